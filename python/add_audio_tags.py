@@ -3,9 +3,17 @@ import builtins  # (unused, but keeping since you had it)
 from pathlib import Path
 import json
 
+from pour_them_all import (
+    DATA_PY_DEFAULT,
+    LESSON_DATA_VAR,
+    lesson_index_path,
+    write_lesson_index,
+)
+
 # === CONFIG ===
 input_path = Path("units.py")
-py_output_path = Path("level_3.py")
+# Written where pour_them_all.py reads it by default, as `data = [...]`.
+py_output_path = Path(DATA_PY_DEFAULT.format(level=3))
 json_output_path = Path("level_3.json")
 target_var = "lesson_blocks_with_html"
 
@@ -54,7 +62,8 @@ data = scope[target_var]
 modified = inject_tags(data)
 
 # === WRITE PYTHON OUTPUT ===
-wrapped_py = f"{target_var} = {to_python_literal(modified)}\n"
+wrapped_py = f"{LESSON_DATA_VAR} = {to_python_literal(modified)}\n"
+py_output_path.parent.mkdir(parents=True, exist_ok=True)
 py_output_path.write_text(wrapped_py, encoding="utf-8")
 print(f"✅ Tagged and saved Python: {py_output_path.resolve()}")
 
@@ -63,4 +72,9 @@ print(f"✅ Tagged and saved Python: {py_output_path.resolve()}")
 # If you prefer a bare array, change `payload = {target_var: modified}` to `payload = modified`.
 payload = {target_var: modified}
 json_output_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-print(f"✅ Tagged and saved JSON:   {json_output_path.resolve()}")
\ No newline at end of file
+print(f"✅ Tagged and saved JSON:   {json_output_path.resolve()}")
+
+# === WRITE LESSON INDEX ===
+# Same index pour_them_all.py writes itself, so it can skip executing the .py.
+write_lesson_index(py_output_path, modified)
+print(f"✅ Wrote lesson index:     {lesson_index_path(py_output_path).resolve()}")
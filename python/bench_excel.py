@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark workbook ingestion in process_excel_files.py: the old full-mode
+openpyxl load against the read-only streaming reader and the fast zipfile/XML
+reader (--engine fast), on the excel/*.xlsx set. All readers must produce the
+same JSON; reports parse time and peak traced memory per workbook.
+
+  python bench_excel.py --input ../excel
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+import openpyxl
+
+from process_excel_files import (
+    iter_sheets_fast,
+    iter_sheets_openpyxl,
+    sheets_to_json_grouped,
+)
+
+
+def legacy_sheets(xlsx_path: Path):
+    # What excel_to_json_grouped used to do: build every cell, then read rows.
+    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
+    for ws in wb.worksheets:
+        yield ws.title, ws.iter_rows(values_only=True)
+
+
+def measure(xlsx_path: Path, reader, repeat: int) -> tuple[dict, float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        data = sheets_to_json_grouped(xlsx_path.name, reader(xlsx_path))
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    sheets_to_json_grouped(xlsx_path.name, reader(xlsx_path))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, best, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Workbook ingestion benchmark")
+    ap.add_argument("--input", default="../excel", type=Path)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    xlsx_files = sorted(args.input.glob("*.xlsx"))
+    if not xlsx_files:
+        print(f"[skip] no .xlsx files under {args.input}")
+        return
+
+    readers = {
+        "full": legacy_sheets,
+        "stream": iter_sheets_openpyxl,
+        "fast": iter_sheets_fast,
+    }
+    totals = {name: [0.0, 0] for name in readers}
+    for path in xlsx_files:
+        results = {
+            name: measure(path, reader, args.repeat) for name, reader in readers.items()
+        }
+        outputs = [data for data, _, _ in results.values()]
+        assert all(out == outputs[0] for out in outputs), path
+        cols = []
+        for name, (_, seconds, peak) in results.items():
+            totals[name][0] += seconds
+            totals[name][1] = max(totals[name][1], peak)
+            cols.append(f"{name}={seconds * 1e3:.0f} ms/{peak / 1e6:.1f} MB")
+        print(f"{path.name}: " + "  ".join(cols))
+
+    print(f"{len(xlsx_files)} workbook(s), total time / max peak memory:")
+    full_s, full_peak = totals["full"]
+    for name, (seconds, peak) in totals.items():
+        print(
+            f"  {name}: {seconds:.2f} s, peak {peak / 1e6:.1f} MB  "
+            f"(vs full: time /{full_s / seconds:.1f}, memory /{full_peak / max(peak, 1):.1f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
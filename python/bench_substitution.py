@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark compile_replacements in pour_them_all.py against the old loop that
+decoded every file before its str.replace calls, on the real template and
+lesson XML. Both replace token by token; the engine skips decoding files
+with no tokens, so the gain is on token-free template files.
+
+  python bench_substitution.py --template-zip data/xxxxx.zip --xml-root data/xml
+"""
+
+import argparse
+import time
+import zipfile
+from pathlib import Path
+
+from pour_them_all import (
+    PLACEHOLDER_TOKENS,
+    TEXT_EXTS,
+    _build_xml_replacements,
+    compile_replacements,
+)
+
+# Both return the text that would be written, or None if the file is left alone.
+
+
+def legacy_replace(data: bytes, replacements: dict) -> str | None:
+    # What replace_in_file / _write_xml_and_cmi5 used to do for every file.
+    text = data.decode("utf-8", errors="ignore")
+    original = text
+    for needle, repl in replacements.items():
+        text = text.replace(needle, repl)
+    return text if text != original else None
+
+
+def engine_replace(data: bytes, sub) -> str | None:
+    if not sub.search(data):
+        return None
+    text = data.decode("utf-8", errors="ignore")
+    replaced = sub(text)
+    return replaced if replaced != text else None
+
+
+def load_template_texts(template_zip: Path) -> list[bytes]:
+    out = []
+    with zipfile.ZipFile(template_zip) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            data = zf.read(info)
+            if Path(info.filename).suffix.lower() not in TEXT_EXTS:
+                try:
+                    data[:8192].decode("utf-8")
+                except UnicodeDecodeError:
+                    continue
+            out.append(data)
+    return out
+
+
+def load_lesson_xml(xml_root: Path, limit: int) -> list[tuple[int, int, bytes]]:
+    out = []
+    for p in sorted(xml_root.glob("xml_output_lvl3_u*/level_3_unit_*_lesson_*.xml")):
+        parts = p.stem.split("_")
+        out.append((int(parts[3]), int(parts[5]), p.read_bytes()))
+        if len(out) >= limit:
+            break
+    return out
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Substitution engine benchmark")
+    ap.add_argument("--template-zip", default="data/xxxxx.zip", type=Path)
+    ap.add_argument("--xml-root", default="data/xml", type=Path)
+    ap.add_argument("--code", default="X80368", help="Lesson code to substitute")
+    ap.add_argument("--lessons", type=int, default=300, help="Max lesson XMLs to use")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    reps = {token: args.code for token in PLACEHOLDER_TOKENS}
+    sub = compile_replacements(reps)
+
+    if args.template_zip.exists():
+        texts = load_template_texts(args.template_zip)
+        for data in texts:
+            assert legacy_replace(data, reps) == engine_replace(data, sub)
+        size = sum(len(t) for t in texts)
+        old = timed(lambda: [legacy_replace(t, reps) for t in texts], args.repeat)
+        new = timed(lambda: [engine_replace(t, sub) for t in texts], args.repeat)
+        print(
+            f"template: {len(texts)} text file(s), {size / 1e6:.2f} MB  "
+            f"loop={old * 1e3:.1f} ms  engine={new * 1e3:.1f} ms  x{old / new:.1f}"
+        )
+    else:
+        print(f"[skip] template zip not found: {args.template_zip}")
+
+    lessons = load_lesson_xml(args.xml_root, args.lessons)
+    if not lessons:
+        print(f"[skip] no lesson XML under {args.xml_root}")
+        return
+    maps = {(u, l): _build_xml_replacements(u, l) for u, l, _ in lessons}
+    subs = {k: compile_replacements(v) for k, v in maps.items()}
+    for u, l, data in lessons:
+        assert legacy_replace(data, maps[u, l]) == engine_replace(data, subs[u, l])
+    size = sum(len(d) for _, _, d in lessons)
+    old = timed(
+        lambda: [legacy_replace(d, maps[u, l]) for u, l, d in lessons], args.repeat
+    )
+    new = timed(
+        lambda: [engine_replace(d, subs[u, l]) for u, l, d in lessons], args.repeat
+    )
+    print(
+        f"cmi5: {len(lessons)} lesson XML(s), {size / 1e6:.2f} MB  "
+        f"loop={old * 1e3:.1f} ms  engine={new * 1e3:.1f} ms  x{old / new:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
 #!/usr/bin/env python3
 import os
+import sys
 import shutil
+import hashlib
 import zipfile
+import zlib
+import gzip
+import struct
+import posixpath
 from pathlib import Path
+from urllib.parse import unquote
+import xml.etree.ElementTree as ET
 import runpy
 import re
 import argparse
+import json
+import math
+import tempfile
+import threading
+import queue
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # -------------------------
 # CONFIGURABLE CONSTANTS
@@ -17,55 +34,104 @@ PLACEHOLDER_TOKENS = ["xxxxx", "XXXXX"]
 # If the template zip has a single-root folder (e.g. "xxxxx/", "xcode/"), flatten it.
 PLACEHOLDER_DIR_CANDIDATES = ["xxxxx", "XXXXX", "xcode", "XCODE"]
 
-# Editable skill labels; update here as you add units.
-skill = {
-    "Unit 1": "Short Vowels, Consonant Blends, Consonant Digraphs",
-    "Unit 2": "Open and Closed Syllables",
-    "Unit 3": "Long a (a, ai, ea, ay, a_e)",
-    "Unit 4": "Long o (o, oa, ow, oe, o_e)",
-    "Unit 5": "Long e (e, e_e, ee, ea, y, ey, ie)",
-    "Unit 6": "Long i (i, ie, y, igh, i_e)",
-    "Unit 7": "Long u (u, ew, ue, u_e)",
-    "Unit 8": "r-Controlled Vowel /är/",
-    "Unit 9": "r-Controlled Vowel /ûr/ (er, ir, ur)",
-    "Unit 10": "r-Controlled Vowel /ôr/ (or, oar, ore)",
-    "Unit 11": "Long e with r (ear, eer, ere)",
-    "Unit 12": "r-Controlled Vowel /âr/ (air, are, ear, ere)",
-    "Unit 13": "VCe Syllables; Consonant -le Syllables",
-    "Unit 14": "/oi/ (oi, oy)",
-    "Unit 15": "/ou/ (ou, ow) Unit 15 /ou/ (ou, ow)",
-    "Unit 16": "/o o / (oo, ui, ew, ue, u, ou, oe, u_e)",
-    "Unit 17": "/˘oo/ (oo, u)",
-    "Unit 19": "Compound Words; Silent Letters (wr, kn, gn)",
-    "Unit 20": "Inflectional Endings with Spelling Changes",
-    "Unit 21": "Related Root Words",
-    "Unit 22": "Irregular Plural Nouns",
-    "Unit 23": "Suffixes -er, -or",
-    "Unit 24": "Comparative and Superlative Suffixes -er, -est",
-    "Unit 25": "Suffixes -y, -ly",
-    "Unit 26": "Schwa",
-    "Unit 27": "Silent Letters /n/ gn, kn; /r/ wr; /m/ mb",
-    "Unit 28": "Possessive Nouns (Singular and Plural)",
-    "Unit 29": "Prefixes un-, re-, dis-",
-    "Unit 30": "Suffixes -ful and -less",
-}
-SKILL_BY_UNIT = skill
-
-# Student book SKUs by unit pairs: (1,2), (3,4), (5,6), ...
-# book1 = first unit in the pair, book2 = second unit in the pair
-STUDENT_BOOK = {
-    "1": "X84145",
-    "2": "X84147",
-    "3": "X84149",
-    "4": "X84151",
-    "5": "X84153",
-    "6": "X84155",
-    # Add more if you have additional books for higher units
+# Extensions always treated as text for placeholder replacement (others are sniffed).
+TEXT_EXTS = {
+    ".html",
+    ".htm",
+    ".css",
+    ".js",
+    ".json",
+    ".txt",
+    ".md",
+    ".xml",
+    ".svg",
+    ".py",
+    ".yaml",
+    ".yml",
+    ".ini",
+    ".cfg",
+    ".ts",
+    ".tsx",
+    ".jsx",
+    ".svelte",
 }
 
+# Level built when --levels is not given.
+DEFAULT_LEVEL = 3
+
+# Per-level tables: {"level<N>": {"units": {"<unit>": value}}}.
+DEFAULT_META_ROOT = "data/meta"
+SKILLS_JSON = "skills.json"
+STUDENT_BOOKS_JSON = "student_books.json"
+
 # Default audio source directory (where lesson audio lives)
 DEFAULT_AUDIO_ROOT = "assets/lesson_audio"
 
+# How audio (and cloned template files) are placed into packages.
+LINK_MODES = ("copy", "hardlink", "reflink", "symlink", "auto", "store")
+
+# Content-addressed store used by --link-mode store, under --out-root by default.
+OBJECTS_DIR = ".objects"
+
+# Already-compressed formats are stored in lesson zips; everything else is deflated.
+ZIP_STORED_EXTS = {
+    ".mp3",
+    ".mp4",
+    ".m4a",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".woff",
+    ".woff2",
+    ".zip",
+}
+
+# Threads used to compress entries of one lesson zip (zlib releases the GIL).
+DEFAULT_ZIP_THREADS = 4
+
+# Per-lesson input fingerprints from the last run, stored under --out-root.
+MANIFEST_NAME = ".build_manifest.json"
+
+# Append-only log of lesson starts/completions, next to the manifest, for --resume.
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+# Tree packages are built under <unit dir>/.staging/<code> and renamed into place.
+STAGING_DIR = ".staging"
+
+# Trees being deleted are renamed to a hidden "<prefix><pid>-<n>-<name>"
+# sibling first, then removed by a background thread (see discard).
+TRASH_PREFIX = ".trash-"
+
+# Scratch dirs and trash left by crashed runs are swept at startup once this
+# old, so a concurrent run (e.g. another --shard) never loses a tree it is still
+# building or deleting.
+ORPHAN_AGE_SECONDS = 3600
+
+# --gzip writes a <file>.gz sibling next to each of these; --minify rewrites
+# the ones minify_asset knows how to shrink safely (JavaScript is left alone).
+MINIFY_EXTS = {".html", ".htm", ".css", ".js", ".json", ".svg"}
+
+# Staged templates kept in the cache besides the one in use; older entries are
+# pruned only once unused for ORPHAN_AGE_SECONDS (another run may be on them).
+TEMPLATE_CACHE_KEEP = 3
+
+# Bump when minify_asset output changes, so minified caches and builds redo it.
+MINIFY_VERSION = 3
+
+# Files smaller than this get no .gz sibling.
+GZIP_MIN_BYTES = 512
+
+# Written at every package root: cmi5 AU url -> audio/image resources, with sizes.
+PRELOAD_NAME = "preload.json"
+
+# AUs whose page plus resources exceed this are flagged by report_preload.
+PRELOAD_WARN_BYTES = 5_000_000
+
+# Bump when packaging logic changes in a way that should invalidate old builds.
+BUILD_VERSION = 2
+
 # -------------------------
 # UTILITIES
 # -------------------------
@@ -86,68 +152,151 @@ def is_text_file(path: Path, sniff_bytes: int = 8192) -> bool:
         return False
 
 
-def replace_in_file(path: Path, replacements: dict):
+def compile_replacements(replacements: dict):
+    """
+    Compile a needle -> value map into a substituter.
+
+    The returned function accepts str or bytes and returns the same type.
+    Needles are replaced one after another in dict order with the C-level
+    replace(), so a {braced} token listed before its bare form wins (see
+    _build_xml_replacements). On the lesson XML this beats a single-pass
+    regex or anchor scan (bench_substitution.py). sub.search(data) is a cheap
+    "contains any needle" check, so token-free files need not be decoded.
+    sub.spans(data) returns the sorted [(offset, needle), ...] occurrences;
+    it matches sub() only for needles that cannot overlap (PLACEHOLDER_TOKENS).
+    """
+    items = tuple((k, v) for k, v in replacements.items() if k)
+    bitems = tuple((k.encode("utf-8"), v.encode("utf-8")) for k, v in items)
+
+    def pairs(data):
+        return bitems if isinstance(data, bytes) else items
+
+    def sub(data):
+        for needle, value in pairs(data):
+            data = data.replace(needle, value)
+        return data
+
+    def search(data):
+        return any(needle in data for needle, _ in pairs(data))
+
+    def spans(data) -> list:
+        out = []
+        for needle, _ in pairs(data):
+            i = data.find(needle)
+            while i != -1:
+                out.append((i, needle))
+                i = data.find(needle, i + len(needle))
+        return sorted(out)
+
+    sub.search = search
+    sub.spans = spans
+    return sub
+
+
+def placeholder_substituter(code: str):
+    return compile_replacements({token: code for token in PLACEHOLDER_TOKENS})
+
+
+def write_text_fresh(path: Path, text: str):
+    """
+    Write via a sibling temp file + rename, so a hardlinked/reflinked/symlinked
+    path gets a new inode instead of overwriting the shared source file.
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    count_io(written=tmp.stat().st_size)
+    if path.exists():
+        shutil.copymode(path, tmp)
+    os.replace(tmp, path)
+
+
+def _reflink(src: Path, dst: Path):
+    """Copy-on-write clone (FICLONE on Linux, clonefile on macOS); raises OSError if unsupported."""
+    if sys.platform == "darwin":
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(dst))
+        return
     try:
-        data = path.read_text(encoding="utf-8", errors="ignore")
-    except Exception:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink not supported on this platform")
+    FICLONE = 0x40049409
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _copy_in_kernel(src: Path, dst: Path):
+    """Plain copy; uses copy_file_range where available so bytes never enter userspace."""
+    if not hasattr(os, "copy_file_range"):
+        shutil.copy2(src, dst)
         return
-    original = data
-    for needle, repl in replacements.items():
-        data = data.replace(needle, repl)
-    if data != original:
-        path.write_text(data, encoding="utf-8")
-
-
-def rename_placeholders_in_tree(root: Path, code: str):
-    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
-        for name in filenames:
-            new_name = name
-            for token in PLACEHOLDER_TOKENS:
-                if token in new_name:
-                    new_name = new_name.replace(token, code)
-            if new_name != name:
-                (Path(dirpath) / name).rename(Path(dirpath) / new_name)
-        for name in dirnames:
-            new_name = name
-            for token in PLACEHOLDER_TOKENS:
-                if token in new_name:
-                    new_name = new_name.replace(token, code)
-            if new_name != name:
-                (Path(dirpath) / name).rename(Path(dirpath) / new_name)
-
-
-def replace_placeholders_in_contents(root: Path, code: str):
-    reps = {token: code for token in PLACEHOLDER_TOKENS}
-    text_exts = {
-        ".html",
-        ".htm",
-        ".css",
-        ".js",
-        ".json",
-        ".txt",
-        ".md",
-        ".xml",
-        ".svg",
-        ".py",
-        ".yaml",
-        ".yml",
-        ".ini",
-        ".cfg",
-        ".ts",
-        ".tsx",
-        ".jsx",
-        ".svelte",
-    }
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [
-            d for d in dirnames if d not in ("__MACOSX", ".git", ".svn", ".DS_Store")
-        ]
-        for fname in filenames:
-            if fname in (".DS_Store",):
-                continue
-            p = Path(dirpath) / fname
-            if p.suffix.lower() in text_exts or is_text_file(p):
-                replace_in_file(p, reps)
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        remaining = os.fstat(fs.fileno()).st_size
+        try:
+            while remaining > 0:
+                n = os.copy_file_range(fs.fileno(), fd.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        except OSError:
+            remaining = -1
+    if remaining != 0:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def place_file(src: Path, dst: Path, mode: str = "copy") -> str:
+    """
+    Put src at dst using mode (see LINK_MODES); returns the method actually used.
+    "auto" tries reflink, then hardlink, then an in-kernel copy.
+    "store" hardlinks dst to src's object in the content-addressed store.
+    An existing dst is unlinked first so a shared inode is never written through.
+    """
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if mode == "store":
+        obj = store_object(src)
+        try:
+            os.link(obj, dst)
+            count_io()
+            return "store"
+        except OSError:
+            # Store on another filesystem; the object is still a valid source.
+            src = obj
+    if mode == "symlink":
+        os.symlink(Path(src).resolve(), dst)
+        count_io()
+        return "symlink"
+    if mode in ("reflink", "auto"):
+        try:
+            _reflink(src, dst)
+            count_io()
+            return "reflink"
+        except OSError:
+            if mode == "reflink":
+                raise
+    if mode in ("hardlink", "auto"):
+        try:
+            os.link(src, dst)
+            count_io()
+            return "hardlink"
+        except OSError:
+            if mode == "hardlink":
+                raise
+    _copy_in_kernel(src, dst)
+    size = os.path.getsize(dst)
+    count_io(read=size, written=size)
+    return "copy"
 
 
 def extract_template_to(template_zip: Path, dest: Path):
@@ -171,9 +320,9 @@ def move_children(src_dir: Path, dest_dir: Path):
                     for f in files:
                         srcf = Path(root) / f
                         dstf = target / rel / f
-                        shutil.copy2(srcf, dstf)
+                        place_file(srcf, dstf)
             else:
-                shutil.copy2(child, target)
+                place_file(child, target)
         else:
             shutil.move(str(child), str(target))
 
@@ -199,11 +348,836 @@ def flatten_if_needed(temp_dir: Path, dest: Path, code: str):
                 move_children(c, dest)
 
 
-def flatten_named_child(dest: Path, name: str):
-    child = dest / name
-    if child.exists() and child.is_dir():
-        move_children(child, dest)
-        safe_rmtree(child)
+# -------------------------
+# BACKGROUND DELETION
+# -------------------------
+
+# Per-process deleter: queue of trashed paths and the thread draining it.
+_TRASH = {"queue": None, "thread": None, "lock": threading.Lock(), "seq": 0}
+
+
+def _trash_worker(q: queue.Queue):
+    while True:
+        path = q.get()
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            q.task_done()
+
+
+def _queue_delete(path: Path):
+    with _TRASH["lock"]:
+        if _TRASH["thread"] is None or not _TRASH["thread"].is_alive():
+            _TRASH["queue"] = queue.Queue()
+            _TRASH["thread"] = threading.Thread(
+                target=_trash_worker, args=(_TRASH["queue"],), daemon=True
+            )
+            _TRASH["thread"].start()
+        _TRASH["queue"].put(path)
+
+
+def discard(path: Path):
+    """
+    Remove path without waiting for it: directories are renamed to a trash
+    sibling (same filesystem, so the rename is instant) and deleted by a
+    background thread. Trash a crashed run leaves behind is picked up by
+    sweep_orphans once it is ORPHAN_AGE_SECONDS old.
+    """
+    if not os.path.lexists(path):
+        return
+    if path.is_symlink() or not path.is_dir():
+        path.unlink()
+        return
+    with _TRASH["lock"]:
+        _TRASH["seq"] += 1
+        seq = _TRASH["seq"]
+    trash = path.with_name(f"{TRASH_PREFIX}{os.getpid()}-{seq}-{path.name}")
+    try:
+        os.rename(path, trash)
+    except OSError:
+        # e.g. path is a mount point; delete in place.
+        shutil.rmtree(path)
+        return
+    try:
+        # Date the trash from now, so sweep_trash's age check means "trashed at".
+        os.utime(trash)
+    except OSError:
+        pass
+    _queue_delete(trash)
+
+
+def sweep_trash(root: Path, min_age: float = ORPHAN_AGE_SECONDS) -> int:
+    """
+    Queue trash under root (and its unit dirs) trashed at least min_age
+    seconds ago; younger trash may still be in the hands of a concurrent run.
+    """
+    found = 0
+    cutoff = time.time() - min_age
+    for pattern in (
+        f"{TRASH_PREFIX}*",
+        f"unit_*/{TRASH_PREFIX}*",
+        f"unit_*/{STAGING_DIR}/{TRASH_PREFIX}*",
+    ):
+        for path in root.glob(pattern):
+            try:
+                if min_age and path.lstat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            _queue_delete(path)
+            found += 1
+    return found
+
+
+def sweep_orphans(out_root: Path, template_cache: Path | None = None) -> int:
+    """
+    Clean up after crashed runs: leftover trash, ._tmp_extract_* dirs, lesson
+    staging folders and half-staged template cache entries. Returns how many
+    trees were queued for deletion.
+    """
+    found = sweep_trash(out_root)
+    scratch = [
+        *out_root.glob("._tmp_extract_*"),
+        *out_root.glob(f"unit_*/{STAGING_DIR}/*"),
+    ]
+    if template_cache is not None:
+        found += sweep_trash(template_cache)
+        scratch += template_cache.glob("._staging_*")
+    cutoff = time.time() - ORPHAN_AGE_SECONDS
+    for path in scratch:
+        try:
+            if path.name.startswith(TRASH_PREFIX) or path.lstat().st_mtime > cutoff:
+                continue
+            discard(path)
+        except FileNotFoundError:
+            continue
+        found += 1
+    return found
+
+
+def drain_trash() -> int:
+    """Block until this process's queued deletions finish; returns how many were pending."""
+    q = _TRASH["queue"]
+    if q is None:
+        return 0
+    pending = q.unfinished_tasks
+    q.join()
+    return pending
+
+
+# -------------------------
+# METRICS
+# -------------------------
+
+# Per-thread recording target: .lesson is {phase: counters} for the lesson
+# being built on this thread, .phase the counters of the phase in progress.
+_METRICS = threading.local()
+
+# Phases recorded per lesson, in build order.
+METRIC_PHASES = ("clean", "replace", "place", "cmi5", "audio", "preload", "sync", "zip")
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Attribute time, files and bytes inside the block to phase name."""
+    lesson = getattr(_METRICS, "lesson", None)
+    if lesson is None:
+        yield
+        return
+    rec = lesson.setdefault(name, {"seconds": 0.0, "files": 0, "read": 0, "written": 0})
+    outer = getattr(_METRICS, "phase", None)
+    _METRICS.phase = rec
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec["seconds"] += time.perf_counter() - t0
+        _METRICS.phase = outer
+
+
+def count_io(files: int = 1, read: int = 0, written: int = 0):
+    rec = getattr(_METRICS, "phase", None)
+    if rec is not None:
+        rec["files"] += files
+        rec["read"] += read
+        rec["written"] += written
+
+
+def _measured(fn, *args):
+    """Run fn(*args) recording its phases; returns (result, phases)."""
+    _METRICS.lesson = phases = {}
+    try:
+        return fn(*args), phases
+    finally:
+        _METRICS.lesson = None
+
+
+def _percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile; values must be sorted.
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(len(values) * q) - 1)]
+
+
+def summarise_metrics(lessons: dict, run: dict) -> dict:
+    """
+    lessons = {manifest_key: {"code", "phases"}} for lessons built this run.
+    Adds per-lesson totals and returns the --metrics document: run info,
+    p50/p95/max and totals per phase, and the ten slowest lessons.
+    """
+    for rec in lessons.values():
+        rec["seconds"] = sum(ph["seconds"] for ph in rec["phases"].values())
+    names = [
+        n for n in METRIC_PHASES if any(n in r["phases"] for r in lessons.values())
+    ]
+    names += sorted(
+        {n for r in lessons.values() for n in r["phases"]} - set(METRIC_PHASES)
+    )
+    phases = {}
+    for name in names:
+        recs = [r["phases"][name] for r in lessons.values() if name in r["phases"]]
+        secs = sorted(ph["seconds"] for ph in recs)
+        phases[name] = {
+            "lessons": len(recs),
+            "p50": _percentile(secs, 0.50),
+            "p95": _percentile(secs, 0.95),
+            "max": secs[-1],
+            "total": sum(secs),
+            "files": sum(ph["files"] for ph in recs),
+            "read": sum(ph["read"] for ph in recs),
+            "written": sum(ph["written"] for ph in recs),
+        }
+    slowest = sorted(lessons.items(), key=lambda kv: -kv[1]["seconds"])[:10]
+    return {
+        "run": run,
+        "phases": phases,
+        "slowest": [
+            {"lesson": key, "code": rec["code"], "seconds": rec["seconds"]}
+            for key, rec in slowest
+        ],
+        "lessons": lessons,
+    }
+
+
+def write_metrics(path: Path, doc: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(doc, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+    print(f"[metrics] {path}")
+    for name, ph in doc["phases"].items():
+        print(
+            f"  {name:<8} p50={ph['p50'] * 1e3:7.1f}ms p95={ph['p95'] * 1e3:7.1f}ms "
+            f"max={ph['max'] * 1e3:7.1f}ms total={ph['total']:.2f}s "
+            f"files={ph['files']} read={ph['read'] / 1e6:.1f}MB "
+            f"written={ph['written'] / 1e6:.1f}MB"
+        )
+    for rec in doc["slowest"][:3]:
+        print(f"  slow: {rec['lesson']} ({rec['code']}) {rec['seconds'] * 1e3:.1f}ms")
+
+
+# -------------------------
+# OBJECT STORE
+# -------------------------
+
+_OBJECT_STORE = None
+
+# (path, size, mtime_ns, inode) -> sha256, so shared template files are hashed once.
+_OBJECT_DIGESTS = {}
+
+
+def set_object_store(root: Path | None):
+    global _OBJECT_STORE
+    _OBJECT_STORE = Path(root) if root else None
+    if _OBJECT_STORE is not None:
+        _OBJECT_STORE.mkdir(parents=True, exist_ok=True)
+
+
+def store_object(src: Path) -> Path:
+    """
+    Return the object holding src's bytes in the store, adding it if missing.
+    Objects are named by sha256 (plus ".x" for executables, since hardlinks
+    share permissions) and are never modified once written.
+    """
+    if _OBJECT_STORE is None:
+        raise RuntimeError("object store not configured (see set_object_store)")
+    st = os.stat(src)
+    key = (str(src), st.st_size, st.st_mtime_ns, st.st_ino)
+    digest = _OBJECT_DIGESTS.get(key)
+    if digest is None:
+        digest = _OBJECT_DIGESTS[key] = file_sha256(Path(src))
+    obj = _OBJECT_STORE / (digest + (".x" if st.st_mode & 0o111 else ""))
+    if not obj.exists():
+        # Per thread too: --pipeline-depth threads may store the same object.
+        tmp = _OBJECT_STORE / f".{obj.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _copy_in_kernel(src, tmp)
+        try:
+            # link() rather than replace(): a concurrent worker that won the
+            # race keeps its inode, so packages already linked to it stay shared.
+            os.link(tmp, obj)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp)
+    elif os.stat(obj).st_nlink <= 1:
+        # An unlinked object being reused; date it now so prune_object_store
+        # leaves it alone until this lesson links it.
+        os.utime(obj)
+    return obj
+
+
+def prune_object_store(root: Path) -> tuple[int, int]:
+    """
+    Delete objects no package links to any more; returns (count, bytes).
+    Objects younger than ORPHAN_AGE_SECONDS are kept: a fresh one has a single
+    link until the lesson storing it (possibly in a concurrent run) links it.
+    """
+    count = size = 0
+    if not root.is_dir():
+        return count, size
+    cutoff = time.time() - ORPHAN_AGE_SECONDS
+    with os.scandir(root) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            st = entry.stat(follow_symlinks=False)
+            if st.st_nlink <= 1 and st.st_mtime <= cutoff:
+                os.unlink(entry.path)
+                count += 1
+                size += st.st_size
+    return count, size
+
+
+def package_footprint(paths) -> tuple[int, int, int]:
+    """
+    (files, logical bytes, physical bytes) under the given package paths:
+    logical sums every file's size, physical counts each inode once, so
+    hardlinked and stored files are only paid for once.
+    """
+    files = logical = physical = 0
+    seen = set()
+    for root in paths:
+        root = Path(root)
+        walk = (
+            [(str(root.parent), [], [root.name])] if root.is_file() else os.walk(root)
+        )
+        for dirpath, _, filenames in walk:
+            for name in filenames:
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                files += 1
+                logical += st.st_size
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    physical += st.st_size
+    return files, logical, physical
+
+
+def report_footprint(paths):
+    files, logical, physical = package_footprint(paths)
+    ratio = logical / physical if physical else 1.0
+    print(
+        f"[footprint] {files} file(s): logical={logical / 1e6:.1f} MB "
+        f"physical={physical / 1e6:.1f} MB (x{ratio:.1f})"
+    )
+
+
+# -------------------------
+# ASSET MINIFICATION
+# -------------------------
+
+_CSS_TOKENS = re.compile(
+    r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')"  # string
+    r"|(/\*.*?\*/)"  # comment
+    r"|(\s+)"  # whitespace
+    r"|([{};,])"  # punctuation that never needs surrounding space
+    r"|(?:\\.|[^\"'/\s{};,\\])+|.",
+    re.S,
+)
+
+
+def _css_word_edge(c: str) -> bool:
+    return c.isalnum() or c in "_-\\" or ord(c) > 127
+
+
+def minify_css(text: str) -> str:
+    """
+    Drop comments (except /*! ... */) and whitespace that separates nothing.
+    A dropped comment leaves no space behind unless the tokens on either side
+    would otherwise run together.
+    """
+    out = []
+    space = gap = False
+    for m in _CSS_TOKENS.finditer(text):
+        string, comment, blank, punct = m.groups()
+        if blank is not None:
+            space = True
+            continue
+        if comment is not None and comment[2:3] != "!":
+            gap = True
+            continue
+        tok = m.group(0)
+        if punct == "}" and out and out[-1] == ";":
+            out.pop()
+        if out and punct is None and out[-1] not in "{};,":
+            if space or (
+                gap and _css_word_edge(out[-1][-1]) and _css_word_edge(tok[0])
+            ):
+                out.append(" ")
+        out.append(tok)
+        space = gap = False
+    return "".join(out)
+
+
+_JSON_TOKENS = re.compile(r'("(?:\\.|[^"\\])*")|([ \t\n\r]+)|[^" \t\n\r]+')
+
+
+def minify_json(text: str) -> str:
+    """
+    Drop whitespace between tokens; values are copied as written. Files that
+    do not parse are left alone.
+    """
+    try:
+        json.loads(text)
+    except ValueError:
+        return text
+    return "".join(
+        m.group(0) for m in _JSON_TOKENS.finditer(text) if m.group(2) is None
+    )
+
+
+_MARKUP_TOKENS = re.compile(
+    r"<!--.*?-->"  # comment, copied as-is
+    r"|<!\[CDATA\[.*?\]\]>"
+    r"|<(pre|textarea|script|style)\b(?:[^>\"']|\"[^\"]*\"|'[^']*')*>.*?</\1\s*>"
+    r"|<(/?)([\w:.-]+)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>"  # element tag
+    r"|<(?:[^>\"']|\"[^\"]*\"|'[^']*')*>"  # doctype, processing instruction
+    r"|(\s+)"  # whitespace between tags / in text
+    r"|[^<\s]+|<",
+    re.S | re.I,
+)
+
+_XML_SPACE_PRESERVE_RE = re.compile(r"\bxml:space\s*=\s*[\"']preserve[\"']", re.I)
+
+
+def minify_markup(text: str) -> str:
+    """
+    HTML/SVG: collapse whitespace runs between tags and in text to one space
+    or line break. Tags, comments, CDATA and the contents of <pre>,
+    <textarea>, <script>, <style> and xml:space="preserve" elements are
+    copied untouched.
+    """
+    out = []
+    preserve, depth = None, 0  # element name whose content is kept verbatim
+    for m in _MARKUP_TOKENS.finditer(text):
+        _, closing, name, attrs, blank = m.groups()
+        if name is not None:
+            self_closing = attrs.rstrip().endswith("/")
+            if preserve is not None:
+                if name == preserve and not self_closing:
+                    depth += -1 if closing else 1
+                    if depth == 0:
+                        preserve = None
+            elif (
+                not closing
+                and not self_closing
+                and _XML_SPACE_PRESERVE_RE.search(attrs)
+            ):
+                preserve, depth = name, 1
+        if blank is not None and preserve is None:
+            out.append("\n" if "\n" in blank else " ")
+        else:
+            out.append(m.group(0))
+    return "".join(out).strip()
+
+
+_MINIFIERS = {
+    ".html": minify_markup,
+    ".htm": minify_markup,
+    ".svg": minify_markup,
+    ".css": minify_css,
+    ".json": minify_json,
+}
+
+
+def minify_asset(name: str, data: bytes) -> bytes:
+    """Minified bytes for a MINIFY_EXTS file; anything else (or no gain) is returned as-is."""
+    minify = _MINIFIERS.get(Path(name).suffix.lower())
+    if minify is None or ".min." in Path(name).name:
+        return data
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data
+    out = minify(text).encode("utf-8")
+    return out if len(out) < len(data) else data
+
+
+def wants_gzip(name: str, size: int) -> bool:
+    return Path(name).suffix.lower() in MINIFY_EXTS and size >= GZIP_MIN_BYTES
+
+
+def gzip_bytes(data: bytes) -> bytes:
+    # No name and mtime=0, so the .gz is reproducible.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def minify_tree(tree: Path) -> dict:
+    """Minify every MINIFY_EXTS file under tree in place; returns {rel: [before, after]}."""
+    sizes = {}
+    for dirpath, _, filenames in os.walk(tree):
+        rel_dir = Path(dirpath).relative_to(tree)
+        if any(part in _CONTENT_SKIP_DIRS for part in rel_dir.parts):
+            continue
+        for fname in filenames:
+            if Path(fname).suffix.lower() not in MINIFY_EXTS:
+                continue
+            p = Path(dirpath) / fname
+            raw = p.read_bytes()
+            out = minify_asset(fname, raw)
+            if out is not raw:
+                p.write_bytes(out)
+            sizes[(rel_dir / fname).as_posix()] = [len(raw), len(out)]
+    return sizes
+
+
+def report_minified(code: str, stats: dict):
+    if not stats["files"]:
+        return
+    before, after = stats["before"], stats["after"]
+    line = (
+        f"[minify] {code}: {stats['files']} asset(s) {before / 1e3:.1f} KB -> "
+        f"{after / 1e3:.1f} KB ({(after - before) / max(before, 1):+.1%})"
+    )
+    if stats["gz"]:
+        line += f"; {stats['gz']} .gz sibling(s), {stats['gz_bytes'] / 1e3:.1f} KB"
+    print(line)
+
+
+# -------------------------
+# TEMPLATE CACHE
+# -------------------------
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_template(
+    template_zip: Path,
+    cache_root: Path,
+    digest: str | None = None,
+    minify: bool = False,
+    gzip_assets: bool = False,
+) -> Path:
+    """
+    Extract + flatten the template zip ONCE into cache_root/<sha256 prefix>/tree
+    and return that tree. A later run with the same template bytes reuses it;
+    see prune_template_cache for when other entries go.
+
+    The staged tree is code-agnostic (placeholders are still in place). An
+    analysis.json next to it records which files carry placeholder tokens,
+    so lessons only rewrite those (see materialise_template).
+
+    With minify/gzip_assets the staged tree is minified and gets .gz siblings
+    for files without placeholders, so every lesson links the results instead
+    of redoing the work; such trees get their own cache entry.
+    """
+    digest = (digest or file_sha256(template_zip))[:16]
+    digest += (f"-min{MINIFY_VERSION}" if minify else "") + (
+        "-gz" if gzip_assets else ""
+    )
+    entry = cache_root / digest
+    tree = entry / "tree"
+    if tree.is_dir():
+        print(f"[template] reusing staged template {entry}")
+        # The entry's mtime is its last use, for prune_template_cache.
+        os.utime(entry)
+        if not (entry / "analysis.json").exists():
+            _write_analysis(tree, minify=minify, gzip_assets=gzip_assets)
+        return tree
+
+    cache_root.mkdir(parents=True, exist_ok=True)
+    prune_template_cache(cache_root, keep=digest)
+
+    # Build in a scratch dir and rename into place so a half-staged tree is never reused.
+    work = Path(tempfile.mkdtemp(prefix=f"._staging_{digest}_", dir=cache_root))
+    try:
+        temp_dir = work / "extract"
+        staged = work / "tree"
+        extract_template_to(template_zip, temp_dir)
+        staged.mkdir()
+        flatten_if_needed(temp_dir, staged, code="")
+        safe_rmtree(temp_dir)
+        sizes = minify_tree(staged) if minify else None
+        _write_analysis(staged, sizes, minify, gzip_assets)
+        try:
+            work.rename(entry)
+        except OSError:
+            # Another process staged the same template first; use theirs.
+            if not tree.is_dir():
+                raise
+    finally:
+        safe_rmtree(work)
+    print(f"[template] staged {template_zip} -> {entry}")
+    return tree
+
+
+def prune_template_cache(cache_root: Path, keep: str) -> int:
+    """
+    Discard staged templates other than keep, beyond the TEMPLATE_CACHE_KEEP
+    most recently used, that nobody has used for ORPHAN_AGE_SECONDS. Runs
+    sharing the cache with other templates (or other --minify/--gzip
+    variants) never lose an entry they are building from.
+    """
+    entries = []
+    for path in cache_root.iterdir():
+        if path.name == keep or path.name.startswith(("._staging_", TRASH_PREFIX)):
+            continue
+        try:
+            if path.is_dir():
+                entries.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    entries.sort(reverse=True)
+    cutoff = time.time() - ORPHAN_AGE_SECONDS
+    pruned = 0
+    for mtime, path in entries[TEMPLATE_CACHE_KEEP:]:
+        if mtime <= cutoff:
+            discard(path)
+            pruned += 1
+    return pruned
+
+
+# path of a staged tree -> its analysis; loaded once per process.
+_TEMPLATE_ANALYSES = {}
+
+# Directories whose files are never scanned for placeholder tokens.
+_CONTENT_SKIP_DIRS = ("__MACOSX", ".git", ".svn", ".DS_Store")
+
+
+def analyse_template(tree: Path) -> dict:
+    """
+    Record, once per staged template, what each lesson has to do with every entry:
+      {"dirs": [rel, ...],
+       "files": {rel: {"spans": [[offset, length], ...],   # placeholder tokens
+                       "lossy": True}}}                    # not clean UTF-8
+    Paths are relative, with placeholders still in them. Files with no spans are
+    static and can be copied or linked into a package untouched.
+    """
+    sub = placeholder_substituter("")
+    dirs = []
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(tree):
+        rel_dir = Path(dirpath).relative_to(tree)
+        skip_contents = any(part in _CONTENT_SKIP_DIRS for part in rel_dir.parts)
+        for d in dirnames:
+            dirs.append((rel_dir / d).as_posix())
+        for fname in filenames:
+            p = Path(dirpath) / fname
+            info = {}
+            if not skip_contents and fname != ".DS_Store":
+                if p.suffix.lower() in TEXT_EXTS or is_text_file(p):
+                    raw = p.read_bytes()
+                    spans = sub.spans(raw)
+                    if spans:
+                        info["spans"] = [[pos, len(n)] for pos, n in spans]
+                        try:
+                            raw.decode("utf-8")
+                        except UnicodeDecodeError:
+                            info["lossy"] = True
+            files[(rel_dir / fname).as_posix()] = info
+    return {"dirs": sorted(dirs), "files": dict(sorted(files.items()))}
+
+
+def load_template_analysis(tree: Path) -> dict:
+    key = str(tree)
+    if key not in _TEMPLATE_ANALYSES:
+        path = tree.parent / "analysis.json"
+        _TEMPLATE_ANALYSES[key] = json.loads(path.read_text(encoding="utf-8"))
+    return _TEMPLATE_ANALYSES[key]
+
+
+def _write_analysis(
+    tree: Path,
+    sizes: dict | None = None,
+    minify: bool = False,
+    gzip_assets: bool = False,
+):
+    analysis = analyse_template(tree)
+    if minify or gzip_assets:
+        analysis["optimise"] = _optimise_staged(
+            tree, analysis, sizes or {}, minify, gzip_assets
+        )
+    path = tree.parent / "analysis.json"
+    tmp = path.with_name(f".analysis.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(analysis), encoding="utf-8")
+    os.replace(tmp, path)
+    touched = sum(1 for v in analysis["files"].values() if v)
+    print(
+        f"[template] analysed {len(analysis['files'])} file(s): "
+        f"{touched} with placeholder tokens"
+    )
+    if sizes:
+        report_minified("template", _minified_stats(analysis, {}))
+
+
+def _optimise_staged(
+    tree: Path, analysis: dict, sizes: dict, minify: bool, gzip_assets: bool
+) -> dict:
+    """
+    Write .gz siblings for static files in the staged tree and add them to
+    analysis; files with placeholder tokens get theirs per lesson (template_plan).
+    Returns the analysis "optimise" entry: the options and {rel: [before, after]}
+    for every minified file.
+    """
+    gz = {}
+    if gzip_assets:
+        for rel, info in list(analysis["files"].items()):
+            p = tree / rel
+            if info or any(part in _CONTENT_SKIP_DIRS for part in p.parts):
+                continue
+            if wants_gzip(rel, p.stat().st_size):
+                data = gzip_bytes(p.read_bytes())
+                (tree / f"{rel}.gz").write_bytes(data)
+                analysis["files"][f"{rel}.gz"] = {}
+                gz[f"{rel}.gz"] = len(data)
+        analysis["files"] = dict(sorted(analysis["files"].items()))
+    return {"minify": minify, "gzip": gzip_assets, "sizes": sizes, "gz": gz}
+
+
+def _minified_stats(analysis: dict, rewritten: dict) -> dict:
+    """
+    Before/after totals for the minified files of one package; rewritten maps
+    template rels to their per-lesson bytes (placeholders replaced), whose
+    length change applies to both sides.
+    """
+    stats = {"files": 0, "before": 0, "after": 0, "gz": 0, "gz_bytes": 0}
+    opt = analysis.get("optimise") or {}
+    for rel, (before, after) in opt.get("sizes", {}).items():
+        delta = len(rewritten[rel]) - after if rel in rewritten else 0
+        stats["files"] += 1
+        stats["before"] += before + delta
+        stats["after"] += after + delta
+    stats["gz"] = len(opt.get("gz", {}))
+    stats["gz_bytes"] = sum(opt.get("gz", {}).values())
+    return stats
+
+
+def _package_rel(rel: str, code: str) -> tuple[str, int]:
+    """
+    Map a staged-template path to its package path: placeholder tokens in
+    every path component become code, then a leading "xcode/" folder and
+    then a leading "<code>/" folder are hoisted into the package root.
+    Returns (package_rel, priority); on a collision the higher priority wins
+    (files from "<code>/" over "xcode/" over the root).
+    """
+    sub = placeholder_substituter(code)
+    parts = [sub(p) for p in rel.split("/") if p]
+    priority = 0
+    for level, nested in enumerate(("xcode", code), start=1):
+        if parts and parts[0] == nested:
+            parts = parts[1:]
+            priority = level
+    return "/".join(parts), priority
+
+
+def _apply_spans(raw: bytes, spans: list, value: bytes) -> bytes:
+    out = []
+    last = 0
+    for pos, length in spans:
+        out.append(raw[last:pos])
+        out.append(value)
+        last = pos + length
+    out.append(raw[last:])
+    return b"".join(out)
+
+
+def template_plan(template_tree: Path, code: str) -> tuple[list, dict]:
+    """
+    The lesson's view of the staged template, without touching dest:
+    (dirs, {package_rel: (src, data)}), where data is the rewritten bytes for
+    files with placeholder tokens and None for files placed as-is from src.
+    """
+    analysis = load_template_analysis(template_tree)
+    dirs = []
+    for rel in analysis["dirs"]:
+        target, _ = _package_rel(rel, code)
+        if target:
+            dirs.append(target)
+
+    planned = []
+    for rel, info in analysis["files"].items():
+        target, priority = _package_rel(rel, code)
+        planned.append((priority, target, rel, info))
+    planned.sort(key=lambda t: t[0])
+
+    value = code.encode("utf-8")
+    files = {}
+    rewritten = {}
+    for _, target, rel, info in planned:
+        src = template_tree / rel
+        if info.get("lossy"):
+            # Not clean UTF-8: decode with errors="ignore", replace, re-encode.
+            raw = src.read_bytes()
+            text = raw.decode("utf-8", errors="ignore")
+            files[target] = (src, placeholder_substituter(code)(text).encode("utf-8"))
+            count_io(read=len(raw))
+        elif info.get("spans"):
+            raw = src.read_bytes()
+            files[target] = (src, _apply_spans(raw, info["spans"], value))
+            count_io(read=len(raw))
+        else:
+            files[target] = (src, None)
+            continue
+        rewritten[rel] = files[target][1]
+
+    opt = analysis.get("optimise")
+    if opt:
+        stats = _minified_stats(analysis, rewritten)
+        if opt["gzip"]:
+            # Static files got their .gz when the template was staged.
+            for _, target, rel, info in planned:
+                data = rewritten.get(rel)
+                if data is not None and wants_gzip(target, len(data)):
+                    gz = gzip_bytes(data)
+                    files[f"{target}.gz"] = (template_tree / rel, gz)
+                    stats["gz"] += 1
+                    stats["gz_bytes"] += len(gz)
+        report_minified(code, stats)
+    return dirs, files
+
+
+def materialise_template(
+    template_tree: Path, dest: Path, code: str, link_mode: str = "copy"
+):
+    """
+    Produce a lesson's copy of the staged template in dest using its analysis:
+    only files with placeholder tokens are read and rewritten (from recorded
+    offsets); everything else is placed with link_mode without being opened.
+    """
+    with timed_phase("replace"):
+        dirs, files = template_plan(template_tree, code)
+    with timed_phase("place"):
+        for rel in dirs:
+            (dest / rel).mkdir(parents=True, exist_ok=True)
+        for rel, (src, data) in files.items():
+            dst = dest / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            if data is None:
+                place_file(src, dst, link_mode)
+            else:
+                dst.write_bytes(data)
+                shutil.copymode(src, dst)
+                count_io(written=len(data))
 
 
 # -------------------------
@@ -212,6 +1186,39 @@ def flatten_named_child(dest: Path, name: str):
 
 _LESSON_META = {}
 
+# Level being built and its tables; set with set_level() (handed to pool workers).
+_LEVEL = {"level": DEFAULT_LEVEL, "skills": {}, "books": {}}
+
+
+def _level_units(path: Path, level: int) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        units = data[f"level{level}"]["units"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    return {int(k): str(v) for k, v in units.items() if str(k).isdigit()}
+
+
+@lru_cache(maxsize=None)
+def load_level_tables(meta_root: Path, level: int) -> dict:
+    """
+    Skill labels and student book SKUs for one level, by unit, from
+    <meta_root>/skills.json and student_books.json.
+    """
+    skills = _level_units(Path(meta_root) / SKILLS_JSON, level)
+    books = _level_units(Path(meta_root) / STUDENT_BOOKS_JSON, level)
+    if not skills or not books:
+        print(
+            f"[warn] level {level}: {len(skills)} skill label(s), "
+            f"{len(books)} student book(s) in {meta_root}"
+        )
+    return {"level": level, "skills": skills, "books": books}
+
+
+def set_level(tables: dict):
+    global _LEVEL
+    _LEVEL = tables
+
 
 def _pair_base_for_unit(unit: int) -> int:
     # Units grouped as (1,2), (3,4), (5,6), ...
@@ -219,31 +1226,41 @@ def _pair_base_for_unit(unit: int) -> int:
 
 
 def _compute_books_for_unit(unit: int):
+    # book1 = first unit in the pair, book2 = second unit in the pair
     base = _pair_base_for_unit(unit)
-    b1 = STUDENT_BOOK.get(str(base), "")
-    b2 = STUDENT_BOOK.get(str(base + 1), "")
+    b1 = _LEVEL["books"].get(base, "")
+    b2 = _LEVEL["books"].get(base + 1, "")
     return b1, b2
 
 
 def _skill_for_unit(unit: int) -> str:
     # Prefer exact, else fall back to first unit in the pair. No "TBD" fallback.
-    exact = SKILL_BY_UNIT.get(f"Unit {unit}")
+    exact = _LEVEL["skills"].get(unit)
     if exact:
         return exact
     base = _pair_base_for_unit(unit)
-    return SKILL_BY_UNIT.get(f"Unit {base}", "")
+    return _LEVEL["skills"].get(base, "")
+
+
+def lesson_xml_path(xml_root: Path, unit: int, lesson: int) -> Path:
+    level = _LEVEL["level"]
+    return (
+        Path(xml_root)
+        / f"xml_output_lvl{level}_u{unit}"
+        / f"level_{level}_unit_{unit}_lesson_{lesson}.xml"
+    )
 
 
 def _build_xml_replacements(unit: int, lesson: int):
     """
-    Build token -> value map for XML:
-      Lvl_3_Unt_{u}_Lsn_{l}:skill
-      Lvl_3_Unt_{u}_Lsn_{l}:book1
-      Lvl_3_Unt_{u}_Lsn_{l}:book2
-      Lvl_3_Unt_{u}_Lsn_{l}:read_aloud_card
+    Build token -> value map for XML (N = the current level):
+      Lvl_N_Unt_{u}_Lsn_{l}:skill
+      Lvl_N_Unt_{u}_Lsn_{l}:book1
+      Lvl_N_Unt_{u}_Lsn_{l}:book2
+      Lvl_N_Unt_{u}_Lsn_{l}:read_aloud_card
     (supports both {braced} and bare forms; braced are replaced first)
     """
-    prefix = f"Lvl_3_Unt_{unit}_Lsn_{lesson}"
+    prefix = f"Lvl_{_LEVEL['level']}_Unt_{unit}_Lsn_{lesson}"
     skill_val = _skill_for_unit(unit)
     book1, book2 = _compute_books_for_unit(unit)
     rac_list = (_LESSON_META.get((unit, lesson)) or {}).get("read_aloud_cards") or []
@@ -296,20 +1313,91 @@ def _parse_range(s: str) -> list[int]:
     return sorted(out)
 
 
-def load_rows_from_units(
-    data_py_path: Path,
-    target_units: list[int] | None = None,
-    lesson_min: int = 1,
-    lesson_max: int = 10,
-):
+# Fields pour_them_all needs per lesson; the slim index keeps only these.
+LESSON_INDEX_FIELDS = ("unit", "lesson", "code", "read_aloud_cards")
+
+# Units data per level, as written by add_audio_tags.py: <LESSON_DATA_VAR> = [...]
+DATA_PY_DEFAULT = "data/level_{level}.py"
+LESSON_DATA_VAR = "data"
+
+
+def lesson_index_path(data_py_path: Path) -> Path:
+    # data/level_3.py -> data/level_3.index.json (written by add_audio_tags.py)
+    return data_py_path.with_suffix(".index.json")
+
+
+def _load_lesson_index(data_py_path: Path) -> list | None:
     """
-    Reads data = [ ... ] from your data_py and returns
+    Return the lesson list from the slim index, or None if it is missing or was
+    built from a different version of data_py (size + sha256 recorded at write time).
+    """
+    index_path = lesson_index_path(data_py_path)
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        src = index["source"]
+        if src["size"] != data_py_path.stat().st_size:
+            return None
+        if src["sha256"] != file_sha256(data_py_path):
+            return None
+        return list(index["lessons"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_lesson_index(data_py_path: Path, items: list):
+    index = {
+        "source": {
+            "name": data_py_path.name,
+            "size": data_py_path.stat().st_size,
+            "sha256": file_sha256(data_py_path),
+        },
+        "lessons": [
+            {k: item.get(k) for k in LESSON_INDEX_FIELDS}
+            for item in items
+            if isinstance(item, dict)
+        ],
+    }
+    index_path = lesson_index_path(data_py_path)
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, index_path)
+
+
+def _load_lesson_items(data_py_path: Path) -> list:
+    items = _load_lesson_index(data_py_path)
+    if items is not None:
+        print(f"[data] using lesson index {lesson_index_path(data_py_path)}")
+        return items
+
+    print(f"[data] lesson index missing or stale; loading {data_py_path}")
+    ns = runpy.run_path(str(data_py_path))
+    items = ns.get(LESSON_DATA_VAR)
+    if not isinstance(items, list):
+        raise ValueError(
+            f"{data_py_path} does not define {LESSON_DATA_VAR} = [...] "
+            "(regenerate it with add_audio_tags.py)"
+        )
+    try:
+        write_lesson_index(data_py_path, items)
+    except OSError as e:
+        print(f"[data][warn] could not write lesson index: {e}")
+    return items
+
+
+def load_rows_from_units(
+    data_py_path: Path,
+    target_units: list[int] | None = None,
+    lesson_min: int = 1,
+    lesson_max: int = 10,
+):
+    """
+    Reads data = [ ... ] from your data_py (via its slim .index.json when that
+    is up to date) and returns
     [(unit, lesson, code), ...] for lessons within [lesson_min, lesson_max].
     If target_units is None or an empty list, includes ALL units found.
     Also fills _LESSON_META with read_aloud_cards per (unit, lesson).
     """
-    ns = runpy.run_path(str(data_py_path))
-    data = ns.get("data", [])
+    data = _load_lesson_items(data_py_path)
 
     global _LESSON_META
     _LESSON_META = {}
@@ -351,34 +1439,38 @@ def load_rows_from_units(
 # -------------------------
 
 
-def _write_xml_and_cmi5(dest: Path, unit: int, lesson: int, xml_root: Path):
+def _render_cmi5(unit: int, lesson: int, xml_root: Path) -> str | None:
     """
-    Copy per-lesson XML into data/xml and also create a root cmi5.xml with token replacement.
-    Looks for source at:
-      <xml_root>/xml_output_lvl3_u{unit}/level_3_unit_{unit}_lesson_{lesson}.xml
-    Writes:
-      {dest}/data/xml/level_3_unit_{unit}_lesson_{lesson}.xml
-      {dest}/cmi5.xml
+    Read the per-lesson XML and return it with tokens replaced, or None if missing.
+    Looks for source at (N = the current level):
+      <xml_root>/xml_output_lvlN_u{unit}/level_N_unit_{unit}_lesson_{lesson}.xml
     """
-    xml_src = (
-        xml_root
-        / f"xml_output_lvl3_u{unit}"
-        / f"level_3_unit_{unit}_lesson_{lesson}.xml"
-    )
+    xml_src = lesson_xml_path(xml_root, unit, lesson)
     print(f"[xml] looking for {xml_src}")
     if not xml_src.exists():
-        print(f"[skip] {dest}: missing source XML: {xml_src}")
-        return
+        print(f"[skip] unit={unit} lesson={lesson}: missing source XML: {xml_src}")
+        return None
 
     try:
-        xml_text = xml_src.read_text(encoding="utf-8", errors="ignore")
+        raw = xml_src.read_bytes()
     except Exception:
-        return
+        return None
+    count_io(read=len(raw))
+    xml_text = raw.decode("utf-8", errors="ignore")
+
+    # Replace tokens ({braced} win over bare by longest match)
+    return compile_replacements(_build_xml_replacements(unit, lesson))(xml_text)
 
-    # Replace tokens (braced first, then bare)
-    repl = _build_xml_replacements(unit, lesson)
-    for k, v in repl.items():
-        xml_text = xml_text.replace(k, v)
+
+def _write_xml_and_cmi5(dest: Path, unit: int, lesson: int, xml_root: Path):
+    """
+    Create a root cmi5.xml with token replacement.
+    Writes:
+      {dest}/cmi5.xml
+    """
+    xml_text = _render_cmi5(unit, lesson, xml_root)
+    if xml_text is None:
+        return
 
     # # Write lesson xml under data/xml
     # data_xml_dir = dest / "data" / "xml"
@@ -388,7 +1480,7 @@ def _write_xml_and_cmi5(dest: Path, unit: int, lesson: int, xml_root: Path):
     # )
 
     # Also write cmi5.xml at the package root
-    (dest / "cmi5.xml").write_text(xml_text, encoding="utf-8")
+    write_text_fresh(dest / "cmi5.xml", xml_text)
 
 
 # -------------------------
@@ -396,93 +1488,1704 @@ def _write_xml_and_cmi5(dest: Path, unit: int, lesson: int, xml_root: Path):
 # -------------------------
 
 
-def _copy_lesson_audio(dest: Path, unit: int, lesson: int, audio_root: Path):
+# level_{L}_unit_{U}_lesson_{S}_{slide}_{n}.mp3 -- the underscore after the lesson
+# number is the boundary that keeps lesson 1 from matching lesson 10.
+AUDIO_NAME_RE = re.compile(
+    r"^level_(\d+)_unit_(\d+)_lesson_(\d+)_.*\.mp3$", re.IGNORECASE
+)
+
+# str(audio_root) -> index; filled once per run (and handed to pool workers).
+_AUDIO_INDEXES = {}
+
+
+def build_audio_index(audio_root: Path) -> dict:
+    """
+    Scan audio_root once and group lesson audio by (level, unit, lesson).
+    Returns {(level, unit, lesson): [(name, path, size, mtime_ns), ...]} sorted by name.
     """
-    Copy all lesson audio files for this unit/lesson into the package's contents/audio folder.
+    index = {}
+    try:
+        it = os.scandir(audio_root)
+    except OSError:
+        return index
+    with it:
+        for e in it:
+            m = AUDIO_NAME_RE.match(e.name)
+            if not m or not e.is_file():
+                continue
+            st = e.stat()
+            key = tuple(int(g) for g in m.groups())
+            index.setdefault(key, []).append(
+                (e.name, e.path, st.st_size, st.st_mtime_ns)
+            )
+    for entries in index.values():
+        entries.sort()
+    return index
+
+
+def _audio_index_for(audio_root: Path) -> dict:
+    key = str(audio_root)
+    if key not in _AUDIO_INDEXES:
+        _AUDIO_INDEXES[key] = build_audio_index(Path(audio_root))
+    return _AUDIO_INDEXES[key]
 
-    Source (inside audio_root):
-        level_3_unit_{unit}_lesson_{lesson}_*.mp3   # underscore ensures lesson boundary
+
+def _lesson_audio_entries(unit: int, lesson: int, audio_root: Path) -> list:
+    return _audio_index_for(audio_root).get((_LEVEL["level"], unit, lesson), [])
+
+
+def _lesson_audio_files(unit: int, lesson: int, audio_root: Path) -> list[Path]:
+    """
+    Return the audio files for this unit/lesson, sorted by name.
+
+    Source (inside audio_root, N = the current level):
+        level_N_unit_{unit}_lesson_{lesson}_*.mp3   # underscore ensures lesson boundary
+    """
+    if not Path(audio_root).exists():
+        print(f"[audio][warn] audio root not found: {audio_root}")
+        return []
+    return [Path(e[1]) for e in _lesson_audio_entries(unit, lesson, audio_root)]
+
+
+def report_audio_index(index: dict, rows):
+    """Print selected lessons with no audio, and audio for unknown lessons in the selected units."""
+    level = _LEVEL["level"]
+    wanted = {(level, u, l) for u, l, _ in rows}
+    units = {u for _, u, _ in wanted}
+    missing = sorted(k for k in wanted if not index.get(k))
+    orphaned = sorted(
+        k for k in index if k[0] == level and k[1] in units and k not in wanted
+    )
+    total = sum(len(v) for v in index.values())
+    print(
+        f"[audio] indexed {total} file(s) for {len(index)} lesson(s); "
+        f"missing={len(missing)} orphaned={len(orphaned)}"
+    )
+    for L, U, S in missing:
+        print(f"  [audio][missing] level_{L} unit_{U} lesson_{S}")
+    for key in orphaned:
+        L, U, S = key
+        print(
+            f"  [audio][orphan] level_{L} unit_{U} lesson_{S}: {len(index[key])} file(s)"
+        )
+
+
+def _copy_lesson_audio(
+    dest: Path, unit: int, lesson: int, audio_root: Path, link_mode: str = "copy"
+):
+    """
+    Copy (or link, per link_mode) all lesson audio files for this unit/lesson into
+    the package's contents/audio folder.
 
     Destination:
         {dest}/contents/audio/<same filename>
     """
-    src_dir = Path(audio_root)
-    if not src_dir.exists():
-        print(f"[audio][warn] audio root not found: {src_dir}")
+    if not Path(audio_root).exists():
+        print(f"[audio][warn] audio root not found: {audio_root}")
         return 0
 
-    # Require an underscore right after the lesson number to avoid matching 10 when lesson=1, etc.
-    hard_glob = f"level_3_unit_{unit}_lesson_{lesson}_*.mp3"
-    boundary_regex = re.compile(
-        rf"^level_3_unit_{unit}_lesson_{lesson}(?:_|$).*\.mp3$", re.IGNORECASE
-    )
-
     target_dir = dest / "contents" / "audio"
     target_dir.mkdir(parents=True, exist_ok=True)
 
     count = 0
-    for p in src_dir.glob(hard_glob):
+    used = {}
+    for p in _lesson_audio_files(unit, lesson, audio_root):
         try:
-            shutil.copy2(p, target_dir / p.name)
+            how = place_file(p, target_dir / p.name, link_mode)
+            used[how] = used.get(how, 0) + 1
             count += 1
         except Exception as e:
             print(f"[audio][err] failed to copy {p} -> {target_dir}: {e}")
 
-    for p in src_dir.glob(f"level_3_unit_{unit}_lesson_{lesson}*.mp3"):
-        if boundary_regex.match(p.name) and not (target_dir / p.name).exists():
-            try:
-                shutil.copy2(p, target_dir / p.name)
-                count += 1
-            except Exception as e:
-                print(f"[audio][err] failed to copy {p} -> {target_dir}: {e}")
-
+    how = ", ".join(f"{k}={v}" for k, v in sorted(used.items()))
     print(
-        f"[audio] {dest.name}: copied {count} file(s) for unit {unit} lesson {lesson}"
+        f"[audio] {dest.name}: placed {count} file(s) for unit {unit} lesson {lesson}"
+        + (f" ({how})" if how else "")
     )
     return count
 
 
 # -------------------------
-# MAIN FLOW
+# PRELOAD MANIFEST
 # -------------------------
 
+PRELOAD_TYPES = {
+    **dict.fromkeys((".mp3", ".m4a", ".aac", ".ogg", ".oga", ".wav"), "audio"),
+    **dict.fromkeys(
+        (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".avif"), "image"
+    ),
+}
 
-def clone_from_zip_for_rows(
-    template_zip: Path, out_root: Path, rows, xml_root: Path, audio_root: Path
+# src/href-style attributes and CSS url(...) in a lesson page.
+_RESOURCE_REF_RE = re.compile(
+    r"""\b(?:src|href|data-src|poster|xlink:href)\s*=\s*["']([^"']+)["']"""
+    r"""|url\(\s*["']?([^"')]+?)["']?\s*\)""",
+    re.I,
+)
+
+
+def cmi5_au_urls(xml_text: str) -> list[tuple[str, str]]:
+    """(AU id, launch url) for every <au> in a cmi5 course structure, in order."""
+    try:
+        root = ET.fromstring(xml_text.encode("utf-8"))
+    except ET.ParseError as e:
+        print(f"[preload][warn] cmi5.xml does not parse: {e}")
+        return []
+    aus = []
+    for el in root.iter():
+        if el.tag.rsplit("}", 1)[-1] != "au":
+            continue
+        url = next(
+            (c.text for c in el if c.tag.rsplit("}", 1)[-1] == "url" and c.text), None
+        )
+        if url:
+            aus.append((el.get("id", ""), url.strip()))
+    return aus
+
+
+def _page_resources(page: str, html: str) -> list[str]:
+    """Package paths of the audio/image files a page references, in page order."""
+    base = posixpath.dirname(page)
+    found = []
+    for m in _RESOURCE_REF_RE.finditer(html):
+        ref = unquote((m.group(1) or m.group(2)).split("#", 1)[0].split("?", 1)[0])
+        if not ref or ref.startswith(("/", "data:")) or "://" in ref:
+            continue
+        if Path(ref).suffix.lower() not in PRELOAD_TYPES:
+            continue
+        path = posixpath.normpath(posixpath.join(base, ref))
+        if not path.startswith("../") and path not in found:
+            found.append(path)
+    return found
+
+
+def build_preload(xml_text: str, sizes: dict, read) -> dict:
+    """
+    The preload manifest of one package. sizes maps every package path to its
+    size and read(path) returns a file's bytes, so this works on a folder, a
+    sync plan or an in-memory zip alike. Each AU lists its page size and the
+    audio/image resources the page references; referenced files that are not
+    in the package are listed under "missing".
+    """
+    aus = []
+    for au_id, url in cmi5_au_urls(xml_text):
+        page = unquote(url.split("#", 1)[0].split("?", 1)[0])
+        entry = {"id": au_id, "url": url, "page_bytes": sizes.get(page)}
+        resources, missing = [], []
+        if page in sizes:
+            html = read(page).decode("utf-8", errors="ignore")
+            for path in _page_resources(page, html):
+                if path in sizes:
+                    kind = PRELOAD_TYPES[Path(path).suffix.lower()]
+                    resources.append({"path": path, "type": kind, "bytes": sizes[path]})
+                else:
+                    missing.append(path)
+        entry["resources"] = resources
+        entry["bytes"] = (entry["page_bytes"] or 0) + sum(r["bytes"] for r in resources)
+        if missing:
+            entry["missing"] = missing
+        aus.append(entry)
+    return {"version": 1, "aus": aus, "bytes": sum(a["bytes"] for a in aus)}
+
+
+def report_preload(code: str, preload: dict):
+    aus = preload["aus"]
+    count = sum(len(a["resources"]) for a in aus)
+    missing = sum(len(a.get("missing", ())) for a in aus)
+    print(
+        f"[preload] {code}: {len(aus)} AU(s), {count} resource(s), "
+        f"{preload['bytes'] / 1e6:.1f} MB" + (f", {missing} missing" if missing else "")
+    )
+    for a in aus:
+        if a["bytes"] > PRELOAD_WARN_BYTES:
+            print(
+                f"[preload][warn] {code}: {a['url']} needs {a['bytes'] / 1e6:.1f} MB "
+                f"(> {PRELOAD_WARN_BYTES / 1e6:.1f} MB)"
+            )
+
+
+def preload_bytes(preload: dict) -> bytes:
+    return json.dumps(preload, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def write_preload(dest: Path, code: str):
+    """Scan a finished package folder once and write its preload.json."""
+    cmi5 = dest / "cmi5.xml"
+    if not cmi5.exists():
+        return
+    sizes = {}
+    for dirpath, _, filenames in os.walk(dest):
+        rel_dir = Path(dirpath).relative_to(dest)
+        for fname in filenames:
+            rel = (rel_dir / fname).as_posix()
+            if rel != PRELOAD_NAME:
+                sizes[rel] = os.stat(os.path.join(dirpath, fname)).st_size
+    preload = build_preload(
+        cmi5.read_text(encoding="utf-8"), sizes, lambda rel: (dest / rel).read_bytes()
+    )
+    write_text_fresh(dest / PRELOAD_NAME, preload_bytes(preload).decode("utf-8"))
+    report_preload(code, preload)
+
+
+def plan_preload(code: str, files: dict) -> bytes | None:
+    """preload.json for a lesson plan ({rel: (src, data)}), or None without cmi5.xml."""
+    if "cmi5.xml" not in files:
+        return None
+
+    def read(rel):
+        src, data = files[rel]
+        return data if data is not None else Path(src).read_bytes()
+
+    sizes = {
+        rel: len(data) if data is not None else os.stat(src).st_size
+        for rel, (src, data) in files.items()
+        if rel != PRELOAD_NAME
+    }
+    preload = build_preload(read("cmi5.xml").decode("utf-8"), sizes, read)
+    report_preload(code, preload)
+    return preload_bytes(preload)
+
+
+# -------------------------
+# REPRODUCIBLE ZIP WRITER
+# -------------------------
+
+# 1980-01-01 00:00:00, the earliest DOS timestamp, for every entry.
+_ZIP_DOS_TIME = 0
+_ZIP_DOS_DATE = (1 << 5) | 1
+_ZIP_FILE_ATTR = (0o100644 << 16) & 0xFFFFFFFF
+_ZIP_DIR_ATTR = ((0o40755 << 16) | 0x10) & 0xFFFFFFFF
+
+
+def _zip_member(item):
+    name, data = item
+    if name.endswith("/"):
+        return name, zipfile.ZIP_STORED, 0, b"", 0
+    crc = zlib.crc32(data)
+    if Path(name).suffix.lower() in ZIP_STORED_EXTS:
+        return name, zipfile.ZIP_STORED, crc, data, len(data)
+    c = zlib.compressobj(6, zlib.DEFLATED, -15)
+    packed = c.compress(data) + c.flush()
+    return name, zipfile.ZIP_DEFLATED, crc, packed, len(data)
+
+
+def write_reproducible_zip(dest: Path, files: dict, threads: int = DEFAULT_ZIP_THREADS):
+    """
+    Write files ({name: bytes}; names ending in "/" are directories) to dest so
+    that identical inputs always give byte-identical archives: entries sorted by
+    name, fixed timestamps and permissions, no extra fields, and compression by
+    extension (ZIP_STORED_EXTS stored, everything else deflated). Entries are
+    compressed in a thread pool and written in order. Parent directory entries
+    are added automatically.
+    """
+    names = set(files)
+    for name in list(files):
+        parts = name.rstrip("/").split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            names.add("/".join(parts[:i]) + "/")
+    items = [(n, files.get(n, b"")) for n in sorted(names)]
+
+    if threads > 1 and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            members = list(pool.map(_zip_member, items))
+    else:
+        members = [_zip_member(item) for item in items]
+
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+    central = []
+    try:
+        with tmp.open("wb") as f:
+            for name, method, crc, packed, size in members:
+                raw_name = name.encode("utf-8")
+                flags = 0x800 if not name.isascii() else 0
+                if len(packed) > 0xFFFFFFFF or f.tell() > 0xFFFFFFFF:
+                    raise ValueError(
+                        f"{dest}: lesson zip too large (zip64 unsupported)"
+                    )
+                offset = f.tell()
+                f.write(
+                    struct.pack(
+                        "<4s5H3L2H",
+                        b"PK\x03\x04",
+                        20,
+                        flags,
+                        method,
+                        _ZIP_DOS_TIME,
+                        _ZIP_DOS_DATE,
+                        crc,
+                        len(packed),
+                        size,
+                        len(raw_name),
+                        0,
+                    )
+                )
+                f.write(raw_name)
+                f.write(packed)
+                attr = _ZIP_DIR_ATTR if name.endswith("/") else _ZIP_FILE_ATTR
+                central.append(
+                    struct.pack(
+                        "<4s2B5H3L5H2L",
+                        b"PK\x01\x02",
+                        20,
+                        3,  # made by: Unix, so external attrs carry permissions
+                        20,
+                        flags,
+                        method,
+                        _ZIP_DOS_TIME,
+                        _ZIP_DOS_DATE,
+                        crc,
+                        len(packed),
+                        size,
+                        len(raw_name),
+                        0,
+                        0,
+                        0,
+                        0,
+                        attr,
+                        offset,
+                    )
+                    + raw_name
+                )
+            cd_offset = f.tell()
+            for record in central:
+                f.write(record)
+            cd_size = f.tell() - cd_offset
+            f.write(
+                struct.pack(
+                    "<4s4H2LH",
+                    b"PK\x05\x06",
+                    0,
+                    0,
+                    len(central),
+                    len(central),
+                    cd_size,
+                    cd_offset,
+                    0,
+                )
+            )
+        count_io(files=len(members), written=tmp.stat().st_size)
+        os.replace(tmp, dest)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def zip_package_dir(src_dir: Path, dest: Path, threads: int = DEFAULT_ZIP_THREADS):
+    """Reproducible zip of a built package folder (same layout as --emit zip)."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        rel = Path(dirpath).relative_to(src_dir)
+        for d in dirnames:
+            files[(rel / d).as_posix() + "/"] = b""
+        for fname in filenames:
+            files[(rel / fname).as_posix()] = (Path(dirpath) / fname).read_bytes()
+    count_io(files=0, read=sum(len(v) for v in files.values()))
+    write_reproducible_zip(dest, files, threads)
+
+
+# -------------------------
+# ZIP EMITTER
+# -------------------------
+
+
+def _package_name_for(
+    entry: str, single_root: bool, code: str
+) -> tuple[str, int] | None:
+    """
+    Map a template zip entry name to its path inside the lesson package: the
+    zip's single root folder (or any top-level folder) is dropped, then
+    _package_rel applies. Returns (name, priority) as _package_rel does, or
+    None for entries that would not end up in the package.
+    """
+    parts = [p for p in entry.split("/") if p]
+    if not parts or parts[0] == "__MACOSX":
+        return None
+    if single_root or len(parts) > 1:
+        parts = parts[1:]
+    rel, priority = _package_rel("/".join(parts), code)
+    if not rel:
+        return None
+    return rel + ("/" if entry.endswith("/") else ""), priority
+
+
+def _replace_in_bytes(name: str, data: bytes, code: str) -> bytes:
+    """
+    Replace placeholder tokens in a zip entry. .DS_Store and entries without
+    tokens are returned as-is; files with a non-text extension are only
+    rewritten if their first 8 KB are valid UTF-8, and are decoded with
+    errors="ignore".
+    """
+    if Path(name).name == ".DS_Store":
+        return data
+    sub = placeholder_substituter(code)
+    if not sub.search(data):
+        return data
+    if Path(name).suffix.lower() not in TEXT_EXTS:
+        try:
+            data[:8192].decode("utf-8")
+        except UnicodeDecodeError:
+            return data
+    text = data.decode("utf-8", errors="ignore")
+    replaced = sub(text)
+    return replaced.encode("utf-8") if replaced != text else data
+
+
+# (template zip, entry name, CRC) -> minified bytes / .gz of them, per process.
+_ZIP_MINIFIED = {}
+_ZIP_GZIPPED = {}
+
+
+def _build_lesson_zip(
+    template_zip: Path,
+    out_root: Path,
+    unit: int,
+    lesson: int,
+    code: str,
+    xml_root: Path,
+    audio_root: Path,
+    zip_threads: int = DEFAULT_ZIP_THREADS,
+    minify: bool = False,
+    gzip_assets: bool = False,
 ):
-    results = []
-    for unit, lesson, code in rows:
-        unit_dir = out_root / f"unit_{unit}"
-        dest = unit_dir / code
+    """
+    Write {out_root}/unit_{unit}/{code}.zip straight from the template zip,
+    without extracting anything to disk. The archive is reproducible (see
+    write_reproducible_zip). minify/gzip_assets apply the same pass as a
+    staged template, cached per process for entries without placeholders.
+    """
+    dest = _dest_for(out_root, unit, code, "zip")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+
+    files = {}
+    with timed_phase("replace"), zipfile.ZipFile(template_zip, "r") as src:
+        tops = {
+            n.split("/", 1)[0]
+            for n in src.namelist()
+            if n.split("/", 1)[0] not in ("__MACOSX", ".DS_Store", "")
+        }
+        single_root = len(tops) == 1 and any(
+            "/" in n for n in src.namelist() if n.split("/", 1)[0] in tops
+        )
+
+        # On collisions the more deeply flattened entry wins, then the later
+        # one, matching move_children overwriting on disk.
+        planned = {}
+        ranks = {}
+        for info in src.infolist():
+            mapped = _package_name_for(info.filename, single_root, code)
+            if mapped is None:
+                continue
+            name, priority = mapped
+            if priority >= ranks.get(name, priority):
+                planned[name] = info
+                ranks[name] = priority
 
-        if dest.exists():
-            shutil.rmtree(dest)
-        unit_dir.mkdir(parents=True, exist_ok=True)
+        print(f"[pkg] unit={unit} lesson={lesson} code={code} -> {dest}")
+        stats = {"files": 0, "before": 0, "after": 0, "gz": 0, "gz_bytes": 0}
+        for name, info in planned.items():
+            if info.is_dir():
+                files[name] = b""
+                continue
+            raw = src.read(info)
+            count_io(read=len(raw))
+            if (
+                not (minify or gzip_assets)
+                or Path(name).suffix.lower() not in MINIFY_EXTS
+                or any(part in _CONTENT_SKIP_DIRS for part in name.split("/"))
+            ):
+                files[name] = _replace_in_bytes(name, raw, code)
+                continue
+            key = (str(template_zip), info.filename, info.CRC)
+            if key not in _ZIP_MINIFIED:
+                _ZIP_MINIFIED[key] = minify_asset(name, raw) if minify else raw
+            data = _ZIP_MINIFIED[key]
+            files[name] = out = _replace_in_bytes(name, data, code)
+            if minify:
+                stats["files"] += 1
+                stats["before"] += len(raw) + len(out) - len(data)
+                stats["after"] += len(out)
+            if gzip_assets and wants_gzip(name, len(out)):
+                if out is not data:
+                    gz = gzip_bytes(out)
+                else:
+                    if key not in _ZIP_GZIPPED:
+                        _ZIP_GZIPPED[key] = gzip_bytes(data)
+                    gz = _ZIP_GZIPPED[key]
+                files[f"{name}.gz"] = gz
+                stats["gz"] += 1
+                stats["gz_bytes"] += len(gz)
+        if minify or gzip_assets:
+            report_minified(code, stats)
+
+    # Lesson files replace any same-named template entries, as on disk.
+    with timed_phase("cmi5"):
+        xml_text = _render_cmi5(unit, lesson, xml_root)
+        if xml_text is not None:
+            files["cmi5.xml"] = xml_text.encode("utf-8")
+
+    with timed_phase("audio"):
+        audio = _lesson_audio_files(unit, lesson, audio_root)
+        if Path(audio_root).exists():
+            # Tree packages always get contents/audio/, even when it stays empty.
+            files["contents/audio/"] = b""
+        for p in audio:
+            files[f"contents/audio/{p.name}"] = p.read_bytes()
+            count_io(read=len(files[f"contents/audio/{p.name}"]))
+    print(
+        f"[audio] {dest.name}: packed {len(audio)} file(s) for unit {unit} lesson {lesson}"
+    )
 
-        temp_dir = out_root / f"._tmp_extract_u{unit}_l{lesson}"
-        safe_rmtree(temp_dir)
-        extract_template_to(template_zip, temp_dir)
+    with timed_phase("preload"):
+        if "cmi5.xml" in files:
+            sizes = {
+                name: len(data)
+                for name, data in files.items()
+                if not name.endswith("/") and name != PRELOAD_NAME
+            }
+            preload = build_preload(
+                files["cmi5.xml"].decode("utf-8"), sizes, files.__getitem__
+            )
+            files[PRELOAD_NAME] = preload_bytes(preload)
+            report_preload(code, preload)
+
+    with timed_phase("zip"):
+        write_reproducible_zip(dest, files, zip_threads)
+    return str(dest)
+
+
+# -------------------------
+# BUILD MANIFEST
+# -------------------------
+
+
+def _dest_for(out_root: Path, unit: int, code: str, emit: str) -> Path:
+    unit_dir = out_root / f"unit_{unit}"
+    return unit_dir / (f"{code}.zip" if emit == "zip" else code)
+
+
+def _manifest_dest(out_root: Path, dest) -> str:
+    # Manifest entries record dest relative to out_root, so a moved or copied
+    # output dir (or a different spelling of --out-root) still matches.
+    try:
+        return Path(dest).relative_to(out_root).as_posix()
+    except ValueError:
+        return str(dest)
+
+
+def _resolve_manifest_dest(out_root: Path, stored: str) -> Path | None:
+    """
+    The output a manifest entry points at, or None if it lies outside out_root.
+    Older manifests stored the path as given on the command line.
+    """
+    p = Path(stored)
+    if not p.is_absolute() and p.parts[:1] and p.parts[0].startswith("unit_"):
+        return out_root / p
+    try:
+        rel = p.resolve().relative_to(out_root.resolve())
+    except (OSError, ValueError):
+        return None
+    return out_root / rel
+
+
+def _manifest_key(unit: int, lesson: int, emit: str) -> str:
+    # Tree and zip outputs are tracked separately so both can coexist.
+    key = f"unit_{unit}/lesson_{lesson}"
+    return key if emit == "tree" else f"{key}@{emit}"
+
+
+def lesson_fingerprint(
+    unit: int,
+    lesson: int,
+    code: str,
+    emit: str,
+    template_digest: str,
+    xml_root: Path,
+    audio_root: Path,
+    link_mode: str = "copy",
+    zip_packages: bool = False,
+    minify: bool = False,
+    gzip_assets: bool = False,
+) -> str:
+    """
+    Hash everything that feeds one lesson package: template bytes, source XML,
+    resolved cmi5 replacements and the matched audio files (name, size, mtime).
+    """
+    xml_src = lesson_xml_path(xml_root, unit, lesson)
+    audio = [
+        [name, size, mtime_ns]
+        for name, _, size, mtime_ns in _lesson_audio_entries(unit, lesson, audio_root)
+    ]
+    payload = {
+        "version": BUILD_VERSION,
+        "level": _LEVEL["level"],
+        "code": code,
+        "emit": emit,
+        "link": link_mode if emit == "tree" else None,
+        "zip": zip_packages if emit == "tree" else None,
+        "minify": MINIFY_VERSION if minify else False,
+        "gzip": gzip_assets,
+        "template": template_digest,
+        "xml": file_sha256(xml_src) if xml_src.exists() else None,
+        "replacements": _build_xml_replacements(unit, lesson),
+        "audio": audio,
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    lessons = data.get("lessons") if isinstance(data, dict) else None
+    return lessons if isinstance(lessons, dict) else {}
+
+
+def save_manifest(path: Path, lessons: dict, shard: dict | None = None):
+    data = {"lessons": lessons}
+    if shard is not None:
+        data["shard"] = shard
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(
+        json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+
+
+def _package_zip_for(dest: Path) -> Path:
+    # Tree packages zipped with --zip-packages sit next to their folder, at the
+    # same path --emit zip would use.
+    return dest if dest.suffix == ".zip" else dest.with_name(dest.name + ".zip")
+
+
+def _remove_output(path: Path):
+    discard(path)
+
+
+# -------------------------
+# BUILD JOURNAL
+# -------------------------
+
+
+def journal_path(manifest_path: Path) -> Path:
+    # .build_manifest.json -> .build_manifest.journal.jsonl
+    return manifest_path.with_name(
+        os.path.splitext(manifest_path.name)[0] + JOURNAL_SUFFIX
+    )
+
+
+def output_signature(dest: Path, zip_packages: bool = False) -> list:
+    """
+    [files, bytes] of a package folder or zip (plus its --zip-packages zip):
+    cheap to recheck, and enough to catch a missing or truncated output.
+    """
+    sig = [0, 0]
+    paths = [dest, _package_zip_for(dest)] if zip_packages else [dest]
+    for path in paths:
+        if path.is_file():
+            sig[0] += 1
+            sig[1] += path.stat().st_size
+            continue
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                sig[0] += 1
+                sig[1] += os.lstat(os.path.join(dirpath, name)).st_size
+    return sig
+
+
+def read_journal(path: Path) -> tuple[dict, set]:
+    """
+    Replay a journal: returns ({key: manifest entry} for lessons whose last
+    event is "done", {keys started but never finished}). A torn last line from
+    a crash is ignored.
+    """
+    done, started = {}, set()
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return done, started
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        key = event.get("key")
+        if event.get("event") == "start":
+            started.add(key)
+            done.pop(key, None)
+        elif event.get("event") == "done":
+            started.discard(key)
+            done[key] = event["entry"]
+        else:
+            started.discard(key)
+            done.pop(key, None)
+    return done, started
+
+
+def open_journal(path: Path, keep: bool = False) -> dict:
+    """Append-only event log for one run; keep=True continues an existing one."""
+    return {
+        "path": path,
+        "lock": threading.Lock(),
+        "file": path.open("a" if keep else "w", encoding="utf-8"),
+    }
 
-        dest.mkdir(parents=True, exist_ok=True)
-        flatten_if_needed(temp_dir, dest, code)
-        safe_rmtree(temp_dir)
 
-        rename_placeholders_in_tree(dest, code)
-        replace_placeholders_in_contents(dest, code)
+def journal_event(journal: dict, event: dict, sync: bool = False):
+    # Safe from several threads; sync=True fsyncs so the event survives a crash.
+    line = json.dumps(event, ensure_ascii=False, sort_keys=True) + "\n"
+    with journal["lock"]:
+        journal["file"].write(line)
+        journal["file"].flush()
+        if sync:
+            os.fsync(journal["file"].fileno())
 
-        # remove accidental nested folders
-        flatten_named_child(dest, "xcode")
-        flatten_named_child(dest, code)
+
+def close_journal(journal: dict, remove: bool = False):
+    journal["file"].close()
+    if remove:
+        journal["path"].unlink(missing_ok=True)
+
+
+# -------------------------
+# SHARDING
+# -------------------------
+
+
+def _parse_shard(s: str) -> tuple[int, int]:
+    """'2/4' -> (2, 4); shards are numbered 1..N."""
+    try:
+        index, count = (int(x) for x in s.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {s!r}")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 1..N, got {s!r}")
+    return index, count
+
+
+def _lesson_weight(unit: int, lesson: int, audio_root: Path) -> int:
+    # Audio dominates package size; everything else is the shared template.
+    return sum(
+        size for _, _, size, _ in _lesson_audio_entries(unit, lesson, audio_root)
+    )
+
+
+def shard_rows(rows, index: int, count: int, audio_root: Path) -> list:
+    """
+    Deterministically split rows into count shards balanced by audio bytes
+    (largest lesson first onto the lightest shard, ties by lesson count, then
+    shard number) and return shard index's rows in their original order.
+    Every host computes the same split from the same inputs.
+    """
+    weighted = sorted(
+        ((_lesson_weight(u, l, audio_root), u, l, c) for u, l, c in rows),
+        key=lambda t: (-t[0], t[1], t[2]),
+    )
+    loads = [[0, 0] for _ in range(count)]
+    owner = {}
+    for weight, unit, lesson, _ in weighted:
+        k = min(range(count), key=lambda k: (loads[k][0], loads[k][1], k))
+        loads[k][0] += weight
+        loads[k][1] += 1
+        owner[unit, lesson] = k + 1
+    mine = [r for r in rows if owner[r[0], r[1]] == index]
+    total = sum(w for w, _, _, _ in weighted)
+    print(
+        f"[shard] {index}/{count}: {len(mine)} of {len(rows)} lesson(s), "
+        f"{loads[index - 1][0] / 1e6:.1f} of {total / 1e6:.1f} MB audio"
+    )
+    return mine
+
+
+def shard_manifest_path(out_root: Path, index: int, count: int) -> Path:
+    stem, ext = os.path.splitext(MANIFEST_NAME)
+    return out_root / f"{stem}.shard-{index}-of-{count}{ext}"
+
+
+# Keys every shard_info block carries; merge_manifests rejects blocks without them.
+SHARD_INFO_KEYS = ("index", "count", "plan", "total", "assigned")
+
+
+def shard_info(all_rows, rows, index: int, count: int, emit: str) -> dict:
+    """What merge-manifests needs to check that the shards fit together."""
+    keys = sorted(_manifest_key(u, l, emit) for u, l, _ in all_rows)
+    return {
+        "index": index,
+        "count": count,
+        "plan": hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest(),
+        "total": len(keys),
+        "assigned": sorted(_manifest_key(u, l, emit) for u, l, _ in rows),
+    }
+
+
+def merge_manifests(paths: list) -> tuple[dict, list]:
+    """
+    Combine partial shard manifests; returns (lessons, problems). Checks that
+    all shards come from the same plan, that shards 1..N are each present once,
+    and that every lesson of the plan was built by exactly one shard.
+    """
+    problems = []
+    merged = {}
+    built_by = {}
+    shards = {}
+    for path in paths:
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            problems.append(f"{path}: unreadable ({e})")
+            continue
+        info = data.get("shard") if isinstance(data, dict) else None
+        if not isinstance(info, dict):
+            problems.append(f"{path}: not a shard manifest")
+            continue
+        absent = [k for k in SHARD_INFO_KEYS if k not in info]
+        if absent:
+            problems.append(f"{path}: shard block lacks {', '.join(absent)}")
+            continue
+        if not isinstance(info["index"], int) or not isinstance(info["assigned"], list):
+            problems.append(f"{path}: malformed shard block")
+            continue
+        if info["index"] in shards:
+            problems.append(f"{path}: shard {info['index']} given twice")
+            continue
+        lessons = data.get("lessons") or {}
+        if not isinstance(lessons, dict):
+            problems.append(f"{path}: malformed lessons block")
+            continue
+        shards[info["index"]] = info
+        for key in info["assigned"]:
+            if key not in lessons:
+                problems.append(f"{path}: {key} was assigned but not built")
+        for key, entry in lessons.items():
+            if key not in info["assigned"]:
+                continue
+            built_by.setdefault(key, []).append(info["index"])
+            merged[key] = entry
+
+    plans = {(i["plan"], i["count"], i["total"]) for i in shards.values()}
+    if len(plans) > 1:
+        problems.append("shards were built from different lesson sets or counts")
+    elif plans:
+        _, count, total = plans.pop()
+        missing = sorted(set(range(1, count + 1)) - set(shards))
+        if missing:
+            problems.append(f"missing shard(s): {', '.join(map(str, missing))}")
+        elif len(built_by) != total:
+            problems.append(f"{len(built_by)} of {total} lesson(s) built")
+    for key, owners in sorted(built_by.items()):
+        if len(owners) > 1:
+            problems.append(f"{key} built by shards {owners}")
+    return merged, problems
+
+
+def merge_manifests_main(argv: list) -> int:
+    ap = argparse.ArgumentParser(
+        prog="pour_them_all.py merge-manifests",
+        description="Merge partial shard manifests into one build manifest.",
+    )
+    ap.add_argument("manifests", nargs="+", help="Partial manifests, one per shard")
+    ap.add_argument(
+        "-o", "--output", default=MANIFEST_NAME, help=f"Default: ./{MANIFEST_NAME}"
+    )
+    args = ap.parse_args(argv)
+
+    lessons, problems = merge_manifests(args.manifests)
+    if problems:
+        print(f"[merge] {len(problems)} problem(s):")
+        for p in problems:
+            print(f"  {p}")
+        return 1
+    save_manifest(Path(args.output), lessons)
+    print(
+        f"[merge] {len(lessons)} lesson(s) from {len(args.manifests)} shard(s) -> {args.output}"
+    )
+    return 0
+
+
+# -------------------------
+# MAIN FLOW
+# -------------------------
+
+
+def _staging_for(dest: Path) -> Path:
+    return dest.parent / STAGING_DIR / dest.name
+
+
+def _clone_lesson_tree(
+    template_tree: Path, out_root: Path, unit: int, code: str, link_mode: str
+) -> Path:
+    """
+    Clone the template into the lesson's staging folder and return it; the
+    package is only moved to its real path by _commit_staged once complete.
+    """
+    staging = _staging_for(_dest_for(out_root, unit, code, "tree"))
+
+    with timed_phase("clean"):
+        # Leftover from a build that died before committing.
+        discard(staging)
+
+    # Clone the pre-flattened template instead of re-extracting the zip; only
+    # files with placeholder tokens are rewritten. Symlinks into the template
+    # cache would dangle once it is pruned, so template files fall back to auto
+    # placement in symlink mode.
+    tree_mode = "auto" if link_mode == "symlink" else link_mode
+    staging.mkdir(parents=True)
+    materialise_template(template_tree, staging, code, tree_mode)
+    return staging
+
+
+def _commit_staged(staging: Path, dest: Path):
+    """
+    Swap a finished staging folder into dest with renames, so dest is always
+    either the previous complete package or the new one, never half-written.
+    """
+    old = staging.with_name(staging.name + ".old")
+    with timed_phase("clean"):
+        discard(old)
+        if dest.exists():
+            os.rename(dest, old)
+        os.rename(staging, dest)
+        # The previous package is deleted in the background.
+        discard(old)
+
+
+def _build_lesson(
+    template_tree: Path,
+    out_root: Path,
+    unit: int,
+    lesson: int,
+    code: str,
+    xml_root: Path,
+    audio_root: Path,
+    link_mode: str = "copy",
+    zip_packages: bool = False,
+    zip_threads: int = DEFAULT_ZIP_THREADS,
+    sync: bool = False,
+):
+    if sync:
+        dest = _sync_lesson(
+            template_tree, out_root, unit, lesson, code, xml_root, audio_root, link_mode
+        )
+    else:
+        dest = _dest_for(out_root, unit, code, "tree")
+        staging = _clone_lesson_tree(template_tree, out_root, unit, code, link_mode)
 
         # add lesson xml + root cmi5.xml
         print(f"[pkg] unit={unit} lesson={lesson} code={code} -> {dest}")
-        _write_xml_and_cmi5(dest, unit, lesson, xml_root)
+        with timed_phase("cmi5"):
+            _write_xml_and_cmi5(staging, unit, lesson, xml_root)
 
         # copy lesson audio
-        _copy_lesson_audio(dest, unit, lesson, audio_root)
+        with timed_phase("audio"):
+            _copy_lesson_audio(staging, unit, lesson, audio_root, link_mode)
+
+        with timed_phase("preload"):
+            write_preload(staging, code)
+
+        _commit_staged(staging, dest)
+
+    if zip_packages:
+        _zip_lesson_package(dest, zip_threads)
+
+    return str(dest)
+
+
+def _zip_lesson_package(dest: Path, zip_threads: int):
+    target = _package_zip_for(dest)
+    with timed_phase("zip"):
+        zip_package_dir(dest, target, zip_threads)
+    print(f"[zip] {dest.name} -> {target}")
+
+
+# -------------------------
+# PACKAGE SYNC
+# -------------------------
+
+
+def lesson_plan(
+    template_tree: Path,
+    unit: int,
+    lesson: int,
+    code: str,
+    xml_root: Path,
+    audio_root: Path,
+) -> tuple[list, dict]:
+    """
+    Everything a lesson package should contain, in memory: the template plan
+    plus cmi5.xml, contents/audio/* and preload.json, as (dirs, {rel: (src, data)}).
+    """
+    with timed_phase("replace"):
+        dirs, files = template_plan(template_tree, code)
+    with timed_phase("cmi5"):
+        xml_text = _render_cmi5(unit, lesson, xml_root)
+        if xml_text is not None:
+            files["cmi5.xml"] = (None, xml_text.encode("utf-8"))
+    with timed_phase("audio"):
+        if Path(audio_root).exists():
+            dirs.append("contents/audio")
+            for p in _lesson_audio_files(unit, lesson, audio_root):
+                files[f"contents/audio/{p.name}"] = (p, None)
+    with timed_phase("preload"):
+        preload = plan_preload(code, files)
+        if preload is not None:
+            files[PRELOAD_NAME] = (None, preload)
+    return dirs, files
+
+
+def _cached_sha256(path: Path) -> str:
+    st = os.stat(path)
+    key = (str(path), st.st_size, st.st_mtime_ns, st.st_ino)
+    digest = _OBJECT_DIGESTS.get(key)
+    if digest is None:
+        digest = _OBJECT_DIGESTS[key] = file_sha256(Path(path))
+    return digest
+
+
+def _is_current(dst: Path, src: Path | None, data: bytes | None, mode: str) -> bool:
+    """Whether dst already holds what place_file/the writer would put there."""
+    st = os.lstat(dst)
+    if mode == "symlink" and data is None:
+        return os.path.islink(dst) and os.readlink(dst) == str(Path(src).resolve())
+    if not os.path.isfile(dst) or os.path.islink(dst):
+        return False
+    if data is not None:
+        return st.st_size == len(data) and dst.read_bytes() == data
+    if mode in ("hardlink", "store"):
+        # Linked modes only count as current when the inode is actually shared.
+        target = store_object(src) if mode == "store" else src
+        return os.path.samefile(dst, target)
+    src_st = os.stat(src)
+    if (src_st.st_dev, src_st.st_ino) == (st.st_dev, st.st_ino):
+        # A hardlink to src is only what "auto" may have placed itself.
+        return mode == "auto"
+    if st.st_nlink > 1:
+        # Shared with something else (an earlier hardlink/store build, the
+        # template cache): writing to the package would write through to it.
+        return False
+    return st.st_size == src_st.st_size and file_sha256(dst) == _cached_sha256(src)
+
+
+def sync_package(
+    dest: Path, dirs: list, files: dict, link_mode: str = "copy", modes=None
+):
+    """
+    Make dest match the plan (see lesson_plan) by applying only differences:
+    missing files are added, files whose size or hash differ are replaced,
+    files and empty directories outside the plan are removed. Unchanged files
+    keep their inode and mtime. modes optionally overrides link_mode per path.
+    Returns {"added", "updated", "removed", "kept"}.
+    """
+    modes = modes or {}
+    stats = {"added": 0, "updated": 0, "removed": 0, "kept": 0}
+    wanted_dirs = {""}
+    for rel in list(dirs) + [str(Path(r).parent) for r in files]:
+        parts = Path(rel).parts
+        for i in range(len(parts) + 1):
+            wanted_dirs.add("/".join(parts[:i]))
+
+    existing_dirs = []
+    if dest.is_dir():
+        for dirpath, dirnames, filenames in os.walk(dest):
+            base = Path(dirpath).relative_to(dest).as_posix()
+            base = "" if base == "." else base + "/"
+            for d in dirnames:
+                if os.path.islink(os.path.join(dirpath, d)):
+                    filenames.append(d)
+                else:
+                    existing_dirs.append(base + d)
+            for f in filenames:
+                if base + f not in files or (base + f) in wanted_dirs:
+                    os.unlink(os.path.join(dirpath, f))
+                    count_io()
+                    stats["removed"] += 1
+    else:
+        dest.mkdir(parents=True)
+
+    for rel in sorted(wanted_dirs - {""}):
+        d = dest / rel
+        if not d.is_dir():
+            d.mkdir(parents=True, exist_ok=True)
+
+    for rel, (src, data) in files.items():
+        dst = dest / rel
+        if dst.is_dir() and not dst.is_symlink():
+            # Deleted here rather than via discard: trash renamed inside the
+            # package would be zipped and hashed along with it.
+            shutil.rmtree(dst)
+        mode = modes.get(rel, link_mode)
+        existed = os.path.lexists(dst)
+        if existed and _is_current(dst, src, data, mode):
+            stats["kept"] += 1
+            continue
+        if data is None:
+            place_file(src, dst, mode)
+        else:
+            tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            count_io(written=len(data))
+            if src is not None:
+                shutil.copymode(src, tmp)
+            os.replace(tmp, dst)
+        stats["updated" if existed else "added"] += 1
+
+    # Deepest first, so emptied parents can go too.
+    for rel in sorted(existing_dirs, key=lambda r: r.count("/"), reverse=True):
+        if rel not in wanted_dirs:
+            d = dest / rel
+            if d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+    return stats
+
+
+def _sync_lesson(
+    template_tree: Path,
+    out_root: Path,
+    unit: int,
+    lesson: int,
+    code: str,
+    xml_root: Path,
+    audio_root: Path,
+    link_mode: str,
+) -> Path:
+    dest = _dest_for(out_root, unit, code, "tree")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    print(f"[pkg] unit={unit} lesson={lesson} code={code} -> {dest}")
+    dirs, files = lesson_plan(template_tree, unit, lesson, code, xml_root, audio_root)
+    _apply_lesson_plan(dest, dirs, files, link_mode)
+    return dest
+
+
+def _apply_lesson_plan(dest: Path, dirs: list, files: dict, link_mode: str):
+    # Symlinks into the template cache would dangle once it is pruned, so
+    # only audio is symlinked (as in _clone_lesson_tree).
+    modes = {}
+    if link_mode == "symlink":
+        modes = {rel: "auto" for rel in files if not rel.startswith("contents/audio/")}
+    with timed_phase("sync"):
+        stats = sync_package(dest, dirs, files, link_mode, modes)
+    print(
+        f"[sync] {dest.name}: +{stats['added']} ~{stats['updated']} "
+        f"-{stats['removed']} ={stats['kept']}"
+    )
+
+
+# -------------------------
+# STAGED PIPELINE
+# -------------------------
+
+_PIPELINE_DONE = object()
+
+
+def run_pipeline(tasks: list, stages: list, depth: int = 2, on_done=None) -> list:
+    """
+    Run every task dict through stages = [(name, fn), ...], one thread per stage,
+    with bounded queues (maxsize=depth) between them, so task N+1's first stage
+    overlaps task N's second stage and so on. fn(task) mutates the task; an
+    exception is stored in task["error"] and later stages skip that task.
+
+    Returns the tasks in input order and prints per-stage busy time and queue
+    occupancy so the bottleneck stage is visible. on_done(task) is called on
+    the calling thread as each task leaves the last stage.
+    """
+    links = [queue.Queue(maxsize=max(1, depth)) for _ in stages[1:]]
+    done = queue.Queue()
+    busy = [0.0] * len(stages)
+    samples = [[] for _ in links]
+
+    def worker(k):
+        _, fn = stages[k]
+        source = iter(tasks) if k == 0 else None
+        out = links[k] if k < len(links) else done
+        while True:
+            task = next(source, _PIPELINE_DONE) if k == 0 else links[k - 1].get()
+            if task is _PIPELINE_DONE:
+                out.put(task)
+                return
+            if task.get("error") is None:
+                t0 = time.perf_counter()
+                try:
+                    fn(task)
+                except Exception as e:
+                    task["error"] = e
+                busy[k] += time.perf_counter() - t0
+            out.put(task)
+            if k < len(links):
+                samples[k].append(out.qsize())
+
+    t0 = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(k,), daemon=True)
+        for k in range(len(stages))
+    ]
+    for t in threads:
+        t.start()
+    finished = []
+    while True:
+        task = done.get()
+        if task is _PIPELINE_DONE:
+            break
+        finished.append(task)
+        if on_done:
+            on_done(task)
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    print(f"[pipeline] {len(finished)} lesson(s) in {wall:.2f}s (queue depth {depth})")
+    slowest = max(range(len(stages)), key=lambda k: busy[k]) if stages else None
+    for k, (name, _) in enumerate(stages):
+        mark = "  <- bottleneck" if k == slowest and len(stages) > 1 else ""
+        print(
+            f"  stage {name:<6} busy={busy[k]:.2f}s ({busy[k] / (wall or 1):.0%}){mark}"
+        )
+        if k < len(links):
+            q = samples[k]
+            avg = sum(q) / len(q) if q else 0.0
+            print(
+                f"    queue -> {stages[k + 1][0]:<6} avg={avg:.1f} max={max(q, default=0)}"
+            )
+    return finished
+
+
+def _pipeline_build_lessons(
+    template_tree: Path,
+    out_root: Path,
+    lessons: list,
+    xml_root: Path,
+    audio_root: Path,
+    link_mode: str,
+    depth: int,
+    zip_packages: bool = False,
+    zip_threads: int = DEFAULT_ZIP_THREADS,
+    sync: bool = False,
+    on_done=None,
+) -> list:
+    """
+    Tree build of [(unit, lesson, code), ...] as a clone -> cmi5 -> audio
+    (-> zip) pipeline, or plan -> sync (-> zip) with sync=True.
+    Returns [(dest_str | Exception, phases), ...] in input order; on_done(pos,
+    dest_str) is called as each lesson completes successfully.
+    """
+
+    def plan(task):
+        task["dest"] = _dest_for(out_root, task["unit"], task["code"], "tree")
+        print(
+            f"[pkg] unit={task['unit']} lesson={task['lesson']} "
+            f"code={task['code']} -> {task['dest']}"
+        )
+        task["plan"] = lesson_plan(
+            template_tree,
+            task["unit"],
+            task["lesson"],
+            task["code"],
+            xml_root,
+            audio_root,
+        )
+
+    def apply(task):
+        task["dest"].parent.mkdir(parents=True, exist_ok=True)
+        _apply_lesson_plan(task["dest"], *task.pop("plan"), link_mode)
+
+    def clone(task):
+        task["dest"] = _dest_for(out_root, task["unit"], task["code"], "tree")
+        task["staging"] = _clone_lesson_tree(
+            template_tree, out_root, task["unit"], task["code"], link_mode
+        )
+
+    def cmi5(task):
+        print(
+            f"[pkg] unit={task['unit']} lesson={task['lesson']} "
+            f"code={task['code']} -> {task['dest']}"
+        )
+        with timed_phase("cmi5"):
+            _write_xml_and_cmi5(task["staging"], task["unit"], task["lesson"], xml_root)
+
+    def audio(task):
+        with timed_phase("audio"):
+            _copy_lesson_audio(
+                task["staging"], task["unit"], task["lesson"], audio_root, link_mode
+            )
+        with timed_phase("preload"):
+            write_preload(task["staging"], task["code"])
+        _commit_staged(task["staging"], task["dest"])
+
+    def package(task):
+        _zip_lesson_package(task["dest"], zip_threads)
+
+    def measured(fn):
+        # Stage threads record into the phases of the task they are working on.
+        def run(task):
+            _METRICS.lesson = task["phases"]
+            try:
+                fn(task)
+            finally:
+                _METRICS.lesson = None
+
+        return run
+
+    if sync:
+        stages = [("plan", plan), ("sync", apply)]
+    else:
+        stages = [("clone", clone), ("cmi5", cmi5), ("audio", audio)]
+    if zip_packages:
+        stages.append(("zip", package))
+    stages = [(name, measured(fn)) for name, fn in stages]
+    tasks = [
+        {"pos": pos, "unit": u, "lesson": l, "code": c, "phases": {}}
+        for pos, (u, l, c) in enumerate(lessons)
+    ]
+
+    def done(task):
+        if on_done and task.get("error") is None:
+            on_done(task["pos"], str(task["dest"]))
+
+    finished = run_pipeline(tasks, stages, depth, on_done=done)
+    return [(t.get("error") or str(t["dest"]), t["phases"]) for t in finished]
+
+
+def _init_worker(
+    lesson_meta: dict, level: dict, audio_indexes: dict, object_store: Path | None
+):
+    # Spawned workers (macOS/Windows default) don't inherit module globals.
+    global _LESSON_META
+    _LESSON_META = lesson_meta
+    set_level(level)
+    _AUDIO_INDEXES.update(audio_indexes)
+    set_object_store(object_store)
+
 
-        results.append(str(dest))
-    return results
+def _reraise(e: Exception):
+    raise e
+
+
+def clone_from_zip_for_rows(
+    template_zip: Path,
+    out_root: Path,
+    rows,
+    xml_root: Path,
+    audio_root: Path,
+    jobs: int = 1,
+    template_cache: Path | None = None,
+    emit: str = "tree",
+    force: bool = False,
+    link_mode: str = "copy",
+    pipeline_depth: int = 0,
+    zip_packages: bool = False,
+    zip_threads: int = DEFAULT_ZIP_THREADS,
+    object_store: Path | None = None,
+    sync: bool = False,
+    shard: dict | None = None,
+    metrics: Path | None = None,
+    resume: bool = False,
+    minify: bool = False,
+    gzip_assets: bool = False,
+):
+    """
+    Build one package per (unit, lesson, code) row.
+    emit="tree" writes <out_root>/unit_N/<code>/; emit="zip" writes
+    <out_root>/unit_N/<code>.zip directly from the template zip.
+    The template is extracted once into template_cache (default:
+    <out_root>/.template_cache) and cloned per lesson.
+
+    Lessons whose fingerprint matches <out_root>/.build_manifest.json and whose
+    output still exists are skipped unless force=True. Outputs left behind by a
+    code change, or by lessons that disappeared from the selected units, are removed.
+
+    Returns (results, errors) in row order:
+      results = [dest_path, ...] for lessons that were built or are up to date
+      errors  = [(unit, lesson, code, message), ...] for lessons that failed
+    With jobs > 1 lessons are built in a process pool.
+    link_mode (tree only) controls how audio and template files are placed.
+    pipeline_depth > 0 (tree only, jobs <= 1) overlaps template clone, cmi5
+    write and audio copy of consecutive lessons in a threaded pipeline.
+    zip_packages (tree only) also writes each package folder to a reproducible
+    <code>.zip beside it; zip entries are compressed on zip_threads threads.
+    The sha256 of every lesson zip is recorded in the manifest.
+    link_mode="store" hardlinks template files and audio from a content-addressed
+    store (object_store, default <out_root>/.objects). Objects no package uses
+    any more are pruned after every build, whatever the link mode.
+    sync=True (tree only) updates existing package folders in place, touching
+    only files that differ, instead of deleting and re-creating them.
+    shard (see shard_info) writes a partial manifest for merge-manifests
+    instead of <out_root>/.build_manifest.json.
+    metrics, if given, receives per-lesson phase timings and I/O counts plus a
+    run summary (see summarise_metrics).
+
+    Lesson starts and completions are journalled next to the manifest as they
+    happen; the journal is removed once the manifest is saved. If a run dies,
+    resume=True skips lessons the journal records as done, after checking
+    their output signature, and rebuilds everything else. Tree packages are
+    built in a staging folder and renamed into place, so a crash never leaves
+    a half-written package at its real path.
+
+    minify / gzip_assets minify HTML/CSS/JSON/SVG assets and add .gz siblings
+    for them and JS (see minify_asset); each package reports its savings.
+    """
+    run_t0 = time.perf_counter()
+    run_phases = {}
+    template_digest = _cached_sha256(template_zip)
+    if shard:
+        manifest_path = shard_manifest_path(out_root, shard["index"], shard["count"])
+    else:
+        manifest_path = out_root / MANIFEST_NAME
+    previous = load_manifest(manifest_path)
+    manifest = dict(previous)
+
+    journal_file = journal_path(manifest_path)
+    journalled, interrupted = {}, set()
+    if resume:
+        journalled, interrupted = read_journal(journal_file)
+        print(
+            f"[journal] {len(journalled)} lesson(s) done, "
+            f"{len(interrupted)} interrupted in the previous run"
+        )
+    elif journal_file.exists():
+        print(
+            f"[journal] discarding {journal_file} from an unfinished run "
+            "(pass --resume to reuse it)"
+        )
+    journal = open_journal(journal_file, keep=resume)
+
+    outcomes = {}
+    todo = []
+    resumed = 0
+    t0 = time.perf_counter()
+    for i, (unit, lesson, code) in enumerate(rows):
+        key = _manifest_key(unit, lesson, emit)
+        dest = _dest_for(out_root, unit, code, emit)
+        fp = lesson_fingerprint(
+            unit,
+            lesson,
+            code,
+            emit,
+            template_digest,
+            xml_root,
+            audio_root,
+            link_mode,
+            zip_packages,
+            minify,
+            gzip_assets,
+        )
+        entry = previous.get(key) or {}
+        zip_ok = (
+            not (emit == "tree" and zip_packages) or _package_zip_for(dest).exists()
+        )
+        if not force and entry.get("fingerprint") == fp and dest.exists() and zip_ok:
+            outcomes[i] = str(dest)
+            manifest[key] = {**entry, "dest": _manifest_dest(out_root, dest)}
+            continue
+        done = journalled.get(key)
+        if (
+            done
+            and done.get("fingerprint") == fp
+            and done.get("output")
+            == output_signature(dest, emit == "tree" and zip_packages)
+        ):
+            outcomes[i] = str(dest)
+            manifest[key] = done
+            resumed += 1
+            continue
+        todo.append((i, fp))
+    run_phases["fingerprint"] = time.perf_counter() - t0
+
+    # Drop outputs that no longer belong to any selected lesson.
+    keys = {
+        _manifest_key(u, l, emit): _dest_for(out_root, u, c, emit) for u, l, c in rows
+    }
+    units = {u for u, _, _ in rows}
+    lessons = [l for _, l, _ in rows]
+    # Never remove what this run keeps or builds, whatever an entry claims.
+    current = {Path(_manifest_dest(out_root, d)) for d in keys.values()}
+    removed = 0
+    for key, entry in previous.items():
+        m = re.fullmatch(r"unit_(\d+)/lesson_(\d+)(?:@(\w+))?", key)
+        if not m or (m.group(3) or "tree") != emit or not entry.get("dest"):
+            continue
+        old_dest = _resolve_manifest_dest(out_root, entry["dest"])
+        unit, lesson = int(m.group(1)), int(m.group(2))
+        if key in keys:
+            stale = old_dest != keys[key]
+        else:
+            stale = unit in units and min(lessons) <= lesson <= max(lessons)
+        if stale and (old_dest is None or old_dest.relative_to(out_root) in current):
+            # Outside out_root (a copied manifest) or still in use: only forget it.
+            if key not in keys:
+                manifest.pop(key, None)
+            continue
+        if stale and shard and key not in shard["assigned"]:
+            # Now another shard's lesson (it may be building it right now, at
+            # the same path); only forget it.
+            manifest.pop(key, None)
+            continue
+        if stale:
+            if old_dest.exists():
+                print(f"[clean] removing stale output {old_dest}")
+                _remove_output(old_dest)
+                removed += 1
+            if entry.get("zip_sha256") and _package_zip_for(old_dest).exists():
+                _remove_output(_package_zip_for(old_dest))
+            if key not in keys:
+                manifest.pop(key, None)
+
+    errors = {}
+    lesson_metrics = {}
+    entries = {}
+    finish_lock = threading.Lock()
+
+    def finish(i, fp, dest):
+        # Runs as soon as a lesson is built (possibly on a pool callback
+        # thread), so the journal records it even if the run dies before
+        # collect() gets to it.
+        with finish_lock:
+            if i not in entries:
+                entries[i] = _finish(i, fp, dest)
+
+    def _finish(i, fp, dest):
+        unit, lesson, code = rows[i]
+        entry = {
+            "code": code,
+            "dest": _manifest_dest(out_root, dest),
+            "fingerprint": fp,
+        }
+        if emit == "zip" or zip_packages:
+            # Lets the upload step skip zips whose bytes did not change.
+            entry["zip_sha256"] = file_sha256(_package_zip_for(Path(dest)))
+        entry["output"] = output_signature(Path(dest), emit == "tree" and zip_packages)
+        key = _manifest_key(unit, lesson, emit)
+        journal_event(journal, {"event": "done", "key": key, "entry": entry}, True)
+        return entry
+
+    def collect(i, fp, fn):
+        unit, lesson, code = rows[i]
+        key = _manifest_key(unit, lesson, emit)
+        try:
+            outcomes[i], phases = fn()
+            lesson_metrics[key] = {"code": code, "phases": phases}
+            finish(i, fp, outcomes[i])
+            manifest[key] = entries[i]
+        except Exception as e:
+            print(f"[err] unit={unit} lesson={lesson} code={code}: {e}")
+            errors[i] = (unit, lesson, code, f"{type(e).__name__}: {e}")
+            journal_event(journal, {"event": "fail", "key": key, "error": errors[i][3]})
+            manifest.pop(key, None)
+
+    def start(i, fp):
+        unit, lesson, _ = rows[i]
+        key = _manifest_key(unit, lesson, emit)
+        journal_event(journal, {"event": "start", "key": key, "fingerprint": fp})
+
+    store_root = object_store or out_root / OBJECTS_DIR
+    if emit == "tree" and link_mode == "store":
+        set_object_store(store_root)
+
+    if todo:
+        t0 = time.perf_counter()
+        if emit == "zip":
+            build, source = _build_lesson_zip, template_zip
+        else:
+            build = _build_lesson
+            source = stage_template(
+                template_zip,
+                template_cache or out_root / ".template_cache",
+                digest=template_digest,
+                minify=minify,
+                gzip_assets=gzip_assets,
+            )
+        run_phases["stage"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+
+        def args_for(i):
+            unit, lesson, code = rows[i]
+            args = (source, out_root, unit, lesson, code, xml_root, audio_root)
+            if emit == "zip":
+                return args + (zip_threads, minify, gzip_assets)
+            return args + (link_mode, zip_packages, zip_threads, sync)
+
+        if emit == "tree" and pipeline_depth > 0 and jobs <= 1:
+            for i, fp in todo:
+                start(i, fp)
+            built = _pipeline_build_lessons(
+                source,
+                out_root,
+                [rows[i] for i, _ in todo],
+                xml_root,
+                audio_root,
+                link_mode,
+                pipeline_depth,
+                zip_packages,
+                zip_threads,
+                sync,
+                on_done=lambda pos, dest: finish(*todo[pos], dest),
+            )
+            for (i, fp), (outcome, phases) in zip(todo, built):
+                if isinstance(outcome, Exception):
+                    collect(i, fp, lambda: _reraise(outcome))
+                else:
+                    collect(i, fp, lambda: (outcome, phases))
+        elif jobs <= 1 or len(todo) <= 1:
+            for i, fp in todo:
+                start(i, fp)
+                collect(i, fp, lambda: _measured(build, *args_for(i)))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(_LESSON_META, _LEVEL, _AUDIO_INDEXES, _OBJECT_STORE),
+            ) as pool:
+                futures = []
+                for i, fp in todo:
+                    start(i, fp)
+                    fut = pool.submit(_measured, build, *args_for(i))
+                    fut.add_done_callback(
+                        lambda f, i=i, fp=fp: f.exception() is None
+                        and finish(i, fp, f.result()[0])
+                    )
+                    futures.append((i, fp, fut))
+                # Collect in submission order so output is deterministic.
+                for i, fp, fut in futures:
+                    collect(i, fp, fut.result)
+            # Workers exit with the pool, possibly mid-delete; finish their trash
+            # here. A concurrent run's fresh trash may get queued too, which is
+            # harmless: both sides just rmtree the same tree.
+            sweep_trash(out_root, min_age=0)
+
+        run_phases["build"] = time.perf_counter() - t0
+
+    save_manifest(manifest_path, manifest, shard)
+    close_journal(journal, remove=True)
+
+    if store_root.is_dir():
+        # Trashed packages still hold links to their objects.
+        drain_trash()
+        pruned, freed = prune_object_store(store_root)
+        if pruned:
+            print(f"[store] pruned {pruned} unused object(s), {freed / 1e6:.1f} MB")
+
+    built = len(todo) - len(errors)
+    skipped = len(rows) - len(todo)
+    print(
+        f"[build] built={built} skipped={skipped} removed={removed} failed={len(errors)}"
+        + (f" resumed={resumed}" if resume else "")
+    )
+    results = [outcomes[i] for i in range(len(rows)) if i in outcomes]
+    if emit == "tree" and results:
+        report_footprint(results)
+    if metrics:
+        run = {
+            "seconds": time.perf_counter() - run_t0,
+            "phases": run_phases,
+            "lessons": len(rows),
+            "built": built,
+            "skipped": skipped,
+            "failed": len(errors),
+            "emit": emit,
+            "link_mode": link_mode,
+            "jobs": jobs,
+        }
+        write_metrics(metrics, summarise_metrics(lesson_metrics, run))
+    return results, [errors[i] for i in sorted(errors)]
 
 
 def cleanup_old_lesson_dirs(out_root: Path):
@@ -490,18 +3193,46 @@ def cleanup_old_lesson_dirs(out_root: Path):
         if unit_dir.is_dir():
             for child in unit_dir.iterdir():
                 if child.is_dir() and child.name.startswith("lesson_"):
-                    safe_rmtree(child)
+                    discard(child)
 
 
 def main():
+    if sys.argv[1:2] == ["merge-manifests"]:
+        sys.exit(merge_manifests_main(sys.argv[2:]))
+
     ap = argparse.ArgumentParser(
-        description="Build per-lesson packages from a template zip."
+        description="Build per-lesson packages from a template zip. "
+        "Run 'merge-manifests' to combine --shard manifests."
     )
     ap.add_argument("--template-zip", default="data/xxxxx.zip")
-    ap.add_argument("--data-py", default="data/level_3.py")
+    ap.add_argument(
+        "--data-py",
+        default=DATA_PY_DEFAULT,
+        help="Units data per level; '{level}' is replaced by the level number. "
+        "Default: data/level_{level}.py",
+    )
     ap.add_argument("--out-root", default="data/output")
     ap.add_argument("--xml-root", default="data/xml")
+    ap.add_argument(
+        "--meta-root",
+        default=DEFAULT_META_ROOT,
+        help="Where skills.json and student_books.json live. "
+        f"Default: {DEFAULT_META_ROOT}",
+    )
+    ap.add_argument(
+        "--levels",
+        default=str(DEFAULT_LEVEL),
+        help="Levels to build in one run, e.g. '3,4'; with more than one, each "
+        "level goes to <out-root>/level_N and all share the template cache, "
+        f"object store and audio index. Default: {DEFAULT_LEVEL}",
+    )
     ap.add_argument("--audio-root", default=DEFAULT_AUDIO_ROOT)
+    ap.add_argument(
+        "--template-cache",
+        default=None,
+        help="Where the extracted template is staged and reused across runs. "
+        "Default: <out-root>/.template_cache",
+    )
     ap.add_argument(
         "--units",
         default="1-3",
@@ -512,26 +3243,127 @@ def main():
         default="1-10",
         help="Lessons to include per unit: '1-10' or '1,3,5'. Default: 1-10",
     )
+    ap.add_argument(
+        "--emit",
+        choices=("tree", "zip"),
+        default="tree",
+        help="tree: package folders (default); zip: one <code>.zip per lesson, "
+        "built straight from the template zip",
+    )
+    ap.add_argument(
+        "--link-mode",
+        choices=LINK_MODES,
+        default="copy",
+        help="How audio and template files land in tree packages: copy (default), "
+        "hardlink, reflink (copy-on-write clone), symlink (audio only), auto "
+        "(reflink, then hardlink, then copy), or store (hardlinks into a "
+        "content-addressed store shared by all packages, see --object-store)",
+    )
+    ap.add_argument(
+        "--object-store",
+        default=None,
+        help="Content-addressed store for --link-mode store; must be on the same "
+        f"filesystem as --out-root. Default: <out-root>/{OBJECTS_DIR}",
+    )
+    ap.add_argument(
+        "--pipeline-depth",
+        type=int,
+        default=0,
+        help="Overlap template clone, cmi5 write and audio copy across lessons "
+        "with queues of this depth (tree output, --jobs 1). Default: 0 (off)",
+    )
+    ap.add_argument(
+        "--zip-packages",
+        action="store_true",
+        help="Also write each tree package to a reproducible <code>.zip beside it "
+        "(same bytes as --emit zip)",
+    )
+    ap.add_argument(
+        "--zip-threads",
+        type=int,
+        default=DEFAULT_ZIP_THREADS,
+        help="Threads compressing entries of each lesson zip. "
+        f"Default: {DEFAULT_ZIP_THREADS}",
+    )
+    ap.add_argument(
+        "--minify",
+        action="store_true",
+        help="Compact JSON, strip CSS comments and whitespace, and collapse "
+        "HTML/SVG whitespace outside <pre>/<textarea>/<script>/<style> and "
+        "xml:space='preserve' (text elsewhere is assumed to use normal "
+        "white-space handling); JavaScript is left as-is",
+    )
+    ap.add_argument(
+        "--gzip",
+        action="store_true",
+        help=f"Write a .gz sibling for each of those assets of {GZIP_MIN_BYTES}+ "
+        "bytes, for static hosting",
+    )
+    ap.add_argument(
+        "--sync",
+        action="store_true",
+        help="Update existing package folders in place, rewriting only new, "
+        "changed or removed files, so unchanged files keep their inode and mtime",
+    )
+    ap.add_argument(
+        "--shard",
+        type=_parse_shard,
+        default=None,
+        metavar="i/N",
+        help="Build only shard i of N (1-based), balanced by audio bytes, and "
+        "write a partial manifest for merge-manifests",
+    )
+    ap.add_argument(
+        "--metrics",
+        default=None,
+        metavar="OUT_JSON",
+        help="Write per-lesson phase timings, files and bytes read/written, and "
+        "a p50/p95/max + slowest-lessons summary to this JSON file",
+    )
+    ap.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run: skip lessons its journal records as "
+        "complete (after checking their output), rebuild the rest",
+    )
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every selected lesson, ignoring the build manifest",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Build lessons in N parallel worker processes (0 = one per CPU). Default: 1",
+    )
     args = ap.parse_args()
 
+    levels = _parse_range(args.levels) or [DEFAULT_LEVEL]
+    if len(levels) > 1 and "{level}" not in args.data_py:
+        ap.error("--data-py needs a '{level}' placeholder when building several levels")
+
     template_zip = Path(args.template_zip)
-    data_py = Path(args.data_py)
     out_root = Path(args.out_root)
     xml_root = Path(args.xml_root)
     audio_root = Path(args.audio_root)
+    meta_root = Path(args.meta_root)
 
     print(f"[config] template_zip={template_zip}")
-    print(f"[config] data_py={data_py}")
+    print(f"[config] data_py={args.data_py}")
     print(f"[config] out_root={out_root}")
     print(f"[config] xml_root={xml_root}")
     print(f"[config] audio_root={audio_root}")
+    print(f"[config] levels={','.join(map(str, levels))}")
 
     out_root.mkdir(parents=True, exist_ok=True)
 
     if not template_zip.exists():
         raise FileNotFoundError(f"Template zip not found: {template_zip}")
-    if not data_py.exists():
-        raise FileNotFoundError(f"Units data not found: {data_py}")
+    for level in levels:
+        data_py = Path(args.data_py.format(level=level))
+        if not data_py.exists():
+            raise FileNotFoundError(f"Units data not found: {data_py}")
     if not xml_root.exists():
         print(f"[warn] XML root not found: {xml_root} (skipping XML copy)")
     if not audio_root.exists():
@@ -546,21 +3378,94 @@ def main():
     else:
         lesson_min, lesson_max = 1, 10
 
-    rows = load_rows_from_units(
-        data_py_path=data_py,
-        target_units=unit_list if unit_list else None,  # None => include all
-        lesson_min=lesson_min,
-        lesson_max=lesson_max,
-    )
-
-    print("Discovered (unit, lesson) -> code:")
-    for unit, lesson, code in rows:
-        print(f"  unit_{unit} lesson_{lesson} -> {code}")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    print(f"[config] jobs={jobs}")
 
-    created = clone_from_zip_for_rows(
-        template_zip, out_root, rows, xml_root, audio_root
+    # Shared by every level: the staged template, the object store and (via
+    # _AUDIO_INDEXES) the audio index.
+    template_cache = (
+        Path(args.template_cache)
+        if args.template_cache
+        else out_root / ".template_cache"
+    )
+    object_store = (
+        Path(args.object_store) if args.object_store else out_root / OBJECTS_DIR
     )
-    cleanup_old_lesson_dirs(out_root)
+
+    swept = sweep_orphans(out_root, template_cache)
+    if len(levels) > 1:
+        swept += sum(sweep_orphans(out_root / f"level_{level}") for level in levels)
+    if swept:
+        print(f"[gc] removing {swept} leftover temp dir(s) in the background")
+
+    created, errors = [], []
+    for level in levels:
+        t0 = time.perf_counter()
+        set_level(load_level_tables(meta_root, level))
+        level_out = out_root / f"level_{level}" if len(levels) > 1 else out_root
+        level_out.mkdir(parents=True, exist_ok=True)
+
+        rows = load_rows_from_units(
+            data_py_path=Path(args.data_py.format(level=level)),
+            target_units=unit_list if unit_list else None,  # None => include all
+            lesson_min=lesson_min,
+            lesson_max=lesson_max,
+        )
+
+        print(f"Discovered level {level} (unit, lesson) -> code:")
+        for unit, lesson, code in rows:
+            print(f"  unit_{unit} lesson_{lesson} -> {code}")
+
+        if audio_root.exists():
+            report_audio_index(_audio_index_for(audio_root), rows)
+
+        shard = None
+        if args.shard:
+            index, count = args.shard
+            all_rows = rows
+            rows = shard_rows(all_rows, index, count, audio_root)
+            shard = shard_info(all_rows, rows, index, count, args.emit)
+
+        metrics = Path(args.metrics) if args.metrics else None
+        if metrics and len(levels) > 1:
+            metrics = metrics.with_name(f"{metrics.stem}.level_{level}{metrics.suffix}")
+
+        print(
+            f"[level] {level}: {len(rows)} lesson(s), setup {time.perf_counter() - t0:.2f}s"
+        )
+        level_created, level_errors = clone_from_zip_for_rows(
+            template_zip,
+            level_out,
+            rows,
+            xml_root,
+            audio_root,
+            jobs=jobs,
+            emit=args.emit,
+            force=args.force,
+            link_mode=args.link_mode,
+            pipeline_depth=args.pipeline_depth,
+            zip_packages=args.zip_packages,
+            zip_threads=max(1, args.zip_threads),
+            object_store=object_store,
+            sync=args.sync,
+            shard=shard,
+            metrics=metrics,
+            resume=args.resume,
+            minify=args.minify,
+            gzip_assets=args.gzip,
+            template_cache=template_cache,
+        )
+        cleanup_old_lesson_dirs(level_out)
+        print(f"[level] {level}: done in {time.perf_counter() - t0:.2f}s")
+        created += level_created
+        errors += [(level,) + e for e in level_errors]
+
+    t0 = time.perf_counter()
+    pending = drain_trash()
+    if pending:
+        print(
+            f"[gc] waited {time.perf_counter() - t0:.2f}s for {pending} background deletion(s)"
+        )
 
     print("\nCreated destinations (sample):")
     for path in created[:20]:
@@ -568,6 +3473,12 @@ def main():
     if len(created) > 20:
         print(f"  ...and {len(created)-20} more")
 
+    if errors:
+        print(f"\n[fail] {len(errors)} lesson(s) failed:")
+        for level, unit, lesson, code, msg in errors:
+            print(f"  level_{level} unit_{unit} lesson_{lesson} ({code}): {msg}")
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
     main()
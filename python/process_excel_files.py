@@ -1,12 +1,25 @@
-import argparse, json, re, string
+import argparse, contextlib, hashlib, io, itertools, json, os, posixpath, re
+import string, zipfile
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
 from pathlib import Path
 
-try:
-    import openpyxl
-except ImportError:
-    raise SystemExit("Please: pip install openpyxl")
+# openpyxl is imported on first use (see _openpyxl), so --engine fast runs
+# without paying for it.
 
 # ---------------- Config ----------------
+# Bump when a change here alters the JSON written for an unchanged workbook.
+CONVERTER_VERSION = 1
+
+# Per-workbook cache keys of the last conversion, kept in the output directory.
+CACHE_NAME = ".excel_cache.json"
+
+CODES_PATH = Path(__file__).parent / "data" / "codes.json"
+
+# Per-lesson sheet fingerprints, one file per output JSON, kept in this
+# subfolder of the output dir so globs over outputs/*.json never see them.
+FINGERPRINTS_DIR = ".fingerprints"
+
 FILETYPE_NORMALIZE = {
     "audio": "Audio Bar",
     "audio bar": "Audio Bar",
@@ -122,29 +135,34 @@ def map_header(raw):
     return None
 
 
-def find_header_row(ws, max_scan=8):
-    hi = min(ws.max_row, max_scan)
-    for r in range(1, hi + 1):
-        row_vals = [cell.value for cell in ws[r]]
+def find_header_row(rows, max_scan=8):
+    """
+    Read up to max_scan rows from a row iterator and pick the header row.
+    Returns (header row number, header values, data rows), where data rows
+    yields the buffered rows after the header followed by the rest of rows.
+    """
+    head = list(itertools.islice(rows, max_scan))
+    for r, row_vals in enumerate(head, start=1):
         mapped = [map_header(v) for v in row_vals]
         if "slide_number" in mapped and "transcription" in mapped:
-            return r, row_vals
-    return 2, [cell.value for cell in ws[2]]
+            return r, row_vals, itertools.chain(head[r:], rows)
+    hdr_values = head[1] if len(head) > 1 else ()
+    return 2, hdr_values, itertools.chain(head[2:], rows)
 
 
-def header_map(ws):
-    hdr_row, hdr_values = find_header_row(ws)
+def header_map(rows):
+    hdr_row, hdr_values, data_rows = find_header_row(rows)
     col_idx = {}
     for idx, h in enumerate(hdr_values):
         m = map_header(h)
         if m and m not in col_idx:
             col_idx[m] = idx
-    return col_idx, hdr_row
+    return col_idx, hdr_row, data_rows
 
 
 # ---------------- Codes Loader ----------------
 def _load_codes():
-    codes_path = Path(__file__).parent / "data" / "codes.json"
+    codes_path = CODES_PATH
     if not codes_path.exists():
         return {}
     try:
@@ -173,28 +191,206 @@ def _load_codes():
 _CODES_BY_BASE = _load_codes()
 
 
+# --------------- Readers ----------------
+ENGINES = ("openpyxl", "fast")
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("Please: pip install openpyxl")
+    return openpyxl
+
+
+def iter_sheets_openpyxl(xlsx_path: Path):
+    """
+    Yield (sheet title, row values iterator) per worksheet, streaming rows with
+    openpyxl's read-only mode instead of building every cell in memory.
+    Each row iterator must be consumed before moving to the next sheet.
+    """
+    wb = _openpyxl().load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            # Don't trust the stored dimensions; stale ones would cut rows off.
+            ws.reset_dimensions()
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Built-in number formats that are (or, locale-dependent, may be) dates/times.
+_DATE_FORMAT_IDS = {*range(14, 23), *range(27, 37), *range(45, 48), *range(50, 59)}
+_FORMAT_LITERALS_RE = re.compile(r'"[^"]*"|\\.|\[[^\]]*\]')
+
+
+class FastPathUnsupported(ValueError):
+    """The workbook uses something the fast reader leaves to openpyxl."""
+
+
+def _text_content(node) -> str:
+    # Plain <t> plus rich-text runs, without phonetic hints (as openpyxl's Text.content).
+    parts = [node.findtext(f"{_MAIN_NS}t") or ""]
+    parts += [r.findtext(f"{_MAIN_NS}t") or "" for r in node.iter(f"{_MAIN_NS}r")]
+    return "".join(parts)
+
+
+def _read_shared_strings(zf: zipfile.ZipFile) -> list:
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    strings = []
+    with zf.open("xl/sharedStrings.xml") as f:
+        for _, node in ET.iterparse(f):
+            if node.tag == f"{_MAIN_NS}si":
+                strings.append(_text_content(node).replace("x005F_", ""))
+                node.clear()
+    return strings
+
+
+def _read_date_styles(zf: zipfile.ZipFile) -> set:
+    """Indexes of cell styles whose number format could be a date or time."""
+    if "xl/styles.xml" not in zf.namelist():
+        return set()
+    root = ET.fromstring(zf.read("xl/styles.xml"))
+    custom = {}
+    for fmt in root.iter(f"{_MAIN_NS}numFmt"):
+        code = _FORMAT_LITERALS_RE.sub("", fmt.get("formatCode", ""))
+        custom[int(fmt.get("numFmtId"))] = bool(re.search(r"[dmyhs]", code, re.I))
+    xfs = root.find(f"{_MAIN_NS}cellXfs")
+    dates = set()
+    for idx, xf in enumerate(xfs if xfs is not None else ()):
+        fmt_id = int(xf.get("numFmtId", 0))
+        if custom.get(fmt_id, fmt_id in _DATE_FORMAT_IDS):
+            dates.add(idx)
+    return dates
+
+
+def _workbook_sheets(zf: zipfile.ZipFile) -> list:
+    """(title, part name) of every worksheet, in workbook order."""
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    for rel in rels.iter(f"{_PKG_REL_NS}Relationship"):
+        if rel.get("Type", "").endswith("/worksheet"):
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join("xl", target))
+            targets[rel.get("Id")] = target
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    return [
+        (sheet.get("name"), targets[sheet.get(f"{_REL_NS}id")])
+        for sheet in workbook.iter(f"{_MAIN_NS}sheet")
+        if sheet.get(f"{_REL_NS}id") in targets
+    ]
+
+
+def _column_index(ref: str) -> int:
+    col = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        col = col * 26 + ord(ch.upper()) - 64
+    return col
+
+
+def _cell_value(cell, shared: list, date_styles: set):
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        node = cell.find(f"{_MAIN_NS}is")
+        return _text_content(node) if node is not None else None
+    value = cell.findtext(f"{_MAIN_NS}v") or None
+    if value is None:
+        return None
+    if kind == "n":
+        if int(cell.get("s", 0)) in date_styles:
+            raise FastPathUnsupported(f"date-formatted cell {cell.get('r')}")
+        if "." in value or "E" in value or "e" in value:
+            return float(value)
+        return int(value)
+    if kind == "s":
+        return shared[int(value)]
+    if kind == "b":
+        return bool(int(value))
+    if kind in ("str", "e"):
+        return value
+    raise FastPathUnsupported(f"cell {cell.get('r')} has type {kind!r}")
+
+
+def _iter_sheet_rows(zf: zipfile.ZipFile, part: str, shared: list, date_styles: set):
+    # Rows in sheet order, gaps yielded as (), like openpyxl's read-only rows.
+    row_tag, cell_tag = f"{_MAIN_NS}row", f"{_MAIN_NS}c"
+    counter = 0
+    with zf.open(part) as f:
+        for _, node in ET.iterparse(f):
+            if node.tag != row_tag:
+                continue
+            idx = int(float(node.get("r"))) if node.get("r") else counter + 1
+            while counter + 1 < idx:
+                counter += 1
+                yield ()
+            counter = idx
+            values = []
+            col = 0
+            for cell in node.iter(cell_tag):
+                ref = cell.get("r")
+                col = _column_index(ref) if ref else col + 1
+                values.extend([None] * (col - 1 - len(values)))
+                values.append(_cell_value(cell, shared, date_styles))
+            node.clear()
+            yield tuple(values)
+
+
+def iter_sheets_fast(xlsx_path: Path):
+    """
+    Same contract as iter_sheets_openpyxl, read straight from the package with
+    zipfile and incremental XML parsing. Covers plain values (shared/inline
+    strings, numbers, booleans, cached formula results); anything else, e.g.
+    date-formatted numbers, raises FastPathUnsupported.
+    """
+    with zipfile.ZipFile(xlsx_path) as zf:
+        shared = _read_shared_strings(zf)
+        date_styles = _read_date_styles(zf)
+        for title, part in _workbook_sheets(zf):
+            yield title, _iter_sheet_rows(zf, part, shared, date_styles)
+
+
 # --------------- Core ----------------
-def excel_to_json_grouped(xlsx_path: Path) -> dict:
-    wb = openpyxl.load_workbook(xlsx_path, data_only=True)
+def excel_to_json_grouped(xlsx_path: Path, engine: str = "openpyxl") -> dict:
+    name = Path(xlsx_path).name
+    if engine == "fast":
+        try:
+            return sheets_to_json_grouped(name, iter_sheets_fast(xlsx_path))
+        except FastPathUnsupported as e:
+            print(f"[fast] {name}: {e}; reading it with openpyxl")
+    return sheets_to_json_grouped(name, iter_sheets_openpyxl(xlsx_path))
+
+
+def sheets_to_json_grouped(workbook_name: str, sheets) -> dict:
+    """Group the (sheet title, rows) pairs of one workbook into the output JSON."""
     out_sheets = []
     grand_total_slides = 0
     grand_total_audio = 0
 
-    for ws in wb.worksheets:
+    for sheet_title, rows in sheets:
         try:
-            base, level, unit, lesson_num = parse_sheet_signature(ws.title)
+            base, level, unit, lesson_num = parse_sheet_signature(sheet_title)
         except Exception as e:
             raise ValueError(
-                f"{xlsx_path.name}: cannot parse Level/Unit/Lesson from sheet name: {ws.title!r}"
+                f"{workbook_name}: cannot parse Level/Unit/Lesson from sheet name: {sheet_title!r}"
             ) from e
 
-        cols, header_row = header_map(ws)
+        cols, header_row, data_rows = header_map(rows)
 
         needed = ["slide_number", "transcription"]
         missing = [c for c in needed if c not in cols]
         if missing:
             raise ValueError(
-                f"Sheet {ws.title!r} missing columns: {missing} (header row={header_row})"
+                f"Sheet {sheet_title!r} missing columns: {missing} (header row={header_row})"
             )
 
         last_slide = None
@@ -204,10 +400,12 @@ def excel_to_json_grouped(xlsx_path: Path) -> dict:
         audio_counts = {}
         slides_by_num = {}
 
-        for row in ws.iter_rows(min_row=header_row + 1, values_only=True):
+        for row in data_rows:
 
             def get(colname):
-                return row[cols[colname]] if colname in cols else None
+                # Streamed rows stop at their last stored cell.
+                idx = cols.get(colname)
+                return row[idx] if idx is not None and idx < len(row) else None
 
             slide = get("slide_number")
             section = get("section")
@@ -284,7 +482,7 @@ def excel_to_json_grouped(xlsx_path: Path) -> dict:
             )
 
         sheet_obj = {
-            "sheet_name": ws.title,
+            "sheet_name": sheet_title,
             "base": base,
             "level": level,
             "unit": unit,
@@ -304,7 +502,7 @@ def excel_to_json_grouped(xlsx_path: Path) -> dict:
     out_sheets.sort(key=lambda s: (s["unit"], s["lesson_num"], s["sheet_name"]))
 
     return {
-        "workbook": Path(xlsx_path).name,
+        "workbook": workbook_name,
         "totals": {
             "sheets": len(out_sheets),
             "slides": grand_total_slides,
@@ -314,6 +512,165 @@ def excel_to_json_grouped(xlsx_path: Path) -> dict:
     }
 
 
+def convert_workbook(input_path: Path, output_dir: Path, pretty: bool, engine: str):
+    """
+    Convert one workbook and write its JSON. Never raises, so one bad workbook
+    can't stop a batch: returns (report text, totals), totals None on failure.
+    Anything printed while converting is part of the report, so parallel
+    workers' output still comes back in input order.
+    """
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            data = excel_to_json_grouped(input_path, engine)
+        out_filename = input_path.with_suffix(".json").name
+        out_path = output_dir / out_filename
+
+        with out_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2 if pretty else None)
+        changed = write_fingerprints(out_path, data)
+
+        print(
+            f"Wrote {out_path}  sheets={data['totals']['sheets']}  "
+            f"slides={data['totals']['slides']}  audio={data['totals']['audio_items']}"
+            + (f"  changed={len(changed)}" if changed is not None else ""),
+            file=log,
+        )
+        if changed:
+            print(f"  changed lessons: {', '.join(changed)}", file=log)
+        return log.getvalue(), data["totals"]
+    except Exception as e:
+        print(f"❌ Error processing {input_path} — {type(e).__name__}: {e}", file=log)
+        return log.getvalue(), None
+
+
+def _convert_all(xlsx_files: list, args, jobs: int):
+    # Yields (path, report, totals) in input order.
+    if jobs <= 1:
+        for path in xlsx_files:
+            yield path, *convert_workbook(path, args.output, args.pretty, args.engine)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(convert_workbook, path, args.output, args.pretty, args.engine)
+            for path in xlsx_files
+        ]
+        for path, fut in zip(xlsx_files, futures):
+            try:
+                yield path, *fut.result()
+            except Exception as e:
+                # The worker process itself died (e.g. BrokenProcessPool).
+                yield path, f"❌ Error processing {path} — {type(e).__name__}: {e}\n", None
+
+
+# --------------- Fingerprints ----------------
+def fingerprints_path(out_path: Path) -> Path:
+    # outputs/Y49395_L3U1.json -> outputs/.fingerprints/Y49395_L3U1.json
+    return out_path.parent / FINGERPRINTS_DIR / out_path.name
+
+
+def sheet_fingerprint(sheet_obj: dict) -> str:
+    """
+    sha256 of a sheet object's content (base, codes, toc, slides, totals).
+    The tab name is left out, so renaming a tab doesn't mark its lesson changed.
+    """
+    payload = {k: v for k, v in sheet_obj.items() if k != "sheet_name"}
+    blob = json.dumps(
+        payload, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def workbook_fingerprints(data: dict) -> dict:
+    """
+    {"workbook", "version", "lessons": {base: {...}}} for a converted workbook.
+    """
+    lessons = {}
+    for s in data["sheets"]:
+        lessons[s["base"]] = {
+            "sheet_name": s["sheet_name"],
+            "level": s["level"],
+            "unit": s["unit"],
+            "lesson_num": s["lesson_num"],
+            "fingerprint": sheet_fingerprint(s),
+        }
+    return {
+        "workbook": data["workbook"],
+        "version": CONVERTER_VERSION,
+        "lessons": lessons,
+    }
+
+
+def write_fingerprints(out_path: Path, data: dict) -> list | None:
+    """
+    Write the sidecar for out_path and return the bases whose fingerprint
+    changed (added, edited or removed) since the previous sidecar, or None
+    if there was none to compare with.
+    """
+    path = fingerprints_path(out_path)
+    try:
+        previous = json.loads(path.read_text(encoding="utf-8")).get("lessons", {})
+    except (OSError, ValueError, AttributeError):
+        previous = None
+    doc = workbook_fingerprints(data)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(
+        json.dumps(doc, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8"
+    )
+    os.replace(tmp, path)
+    if previous is None:
+        return None
+    current = doc["lessons"]
+    return sorted(
+        base
+        for base in current.keys() | previous.keys()
+        if (current.get(base) or {}).get("fingerprint")
+        != (previous.get(base) or {}).get("fingerprint")
+    )
+
+
+# --------------- Cache ----------------
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def cache_key(xlsx_path: Path, pretty: bool) -> dict:
+    """Everything the JSON for a workbook depends on; the engine doesn't change it."""
+    codes = json.dumps(_CODES_BY_BASE, sort_keys=True, ensure_ascii=False)
+    return {
+        "version": CONVERTER_VERSION,
+        "workbook": file_sha256(xlsx_path),
+        "codes": hashlib.sha256(codes.encode("utf-8")).hexdigest(),
+        "pretty": pretty,
+    }
+
+
+def load_cache(output_dir: Path) -> dict:
+    try:
+        data = json.loads((output_dir / CACHE_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_cache(output_dir: Path, cache: dict):
+    path = output_dir / CACHE_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(cache, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def cached_output(entry: dict | None, key: dict, out_path: Path) -> bool:
+    # Reusable only if the key matches and the output wasn't edited or removed.
+    return bool(
+        entry
+        and entry.get("key") == key
+        and out_path.exists()
+        and entry.get("output_sha256") == file_sha256(out_path)
+    )
+
+
 # --------------- CLI ----------------
 def main():
     ap = argparse.ArgumentParser(
@@ -336,6 +693,25 @@ def main():
         help="Output directory to write JSON files",
     )
     ap.add_argument("--pretty", action="store_true", help="Pretty-print JSON")
+    ap.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="openpyxl",
+        help="Workbook reader: openpyxl, or fast (zipfile + XML; falls back to "
+        "openpyxl for workbooks it does not cover)",
+    )
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help=f"Convert every workbook, ignoring the cache in <output>/{CACHE_NAME}",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Convert workbooks in N parallel worker processes (0 = one per CPU). "
+        "Default: 1",
+    )
     args = ap.parse_args()
 
     # Collect .xlsx files from all inputs (files and/or directories)
@@ -354,23 +730,57 @@ def main():
     # Ensure output directory exists
     args.output.mkdir(parents=True, exist_ok=True)
 
-    for input_path in xlsx_files:
-        try:
-            data = excel_to_json_grouped(input_path)
-            out_filename = input_path.with_suffix(".json").name
-            out_path = args.output / out_filename
-
-            with out_path.open("w", encoding="utf-8") as f:
-                json.dump(
-                    data, f, ensure_ascii=False, indent=2 if args.pretty else None
-                )
-
+    # Unchanged workbooks keep their previous JSON without being opened.
+    cache = load_cache(args.output)
+    keys = {}
+    todo = []
+    for path in xlsx_files:
+        keys[path] = cache_key(path, args.pretty)
+        out_path = args.output / path.with_suffix(".json").name
+        if args.force or not cached_output(cache.get(path.name), keys[path], out_path):
+            todo.append(path)
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    jobs = max(1, min(jobs, len(todo)))
+    results = _convert_all(todo, args, jobs)
+    to_convert = set(todo)
+
+    converted = cached = failed = 0
+    totals = {"sheets": 0, "slides": 0, "audio_items": 0}
+    for path in xlsx_files:
+        out_path = args.output / path.with_suffix(".json").name
+        if path in to_convert:
+            _, report, wb_totals = next(results)
+            print(report, end="")
+            if wb_totals is None:
+                failed += 1
+                cache.pop(path.name, None)
+                continue
+            converted += 1
+            cache[path.name] = {
+                "key": keys[path],
+                "output_sha256": file_sha256(out_path),
+                "totals": wb_totals,
+            }
+        else:
+            cached += 1
+            wb_totals = cache[path.name]["totals"]
+            if not fingerprints_path(out_path).exists():
+                data = json.loads(out_path.read_text(encoding="utf-8"))
+                write_fingerprints(out_path, data)
             print(
-                f"Wrote {out_path}  sheets={data['totals']['sheets']}  "
-                f"slides={data['totals']['slides']}  audio={data['totals']['audio_items']}"
+                f"Cached {out_path}  sheets={wb_totals['sheets']}  "
+                f"slides={wb_totals['slides']}  audio={wb_totals['audio_items']}"
             )
-        except Exception as e:
-            print(f"❌ Error processing {input_path} — {type(e).__name__}: {e}")
+        for key in totals:
+            totals[key] += wb_totals[key]
+    save_cache(args.output, cache)
+
+    print(
+        f"{'❌' if failed else '✅'} {converted} converted, {cached} cached, "
+        f"{failed} failed (jobs={jobs})  sheets={totals['sheets']}  "
+        f"slides={totals['slides']}  audio={totals['audio_items']}"
+    )
 
 
 if __name__ == "__main__":
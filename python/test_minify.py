@@ -0,0 +1,75 @@
+"""
+Regression tests for the --minify transforms in pour_them_all.py.
+
+  python -m pytest -q test_minify.py
+"""
+
+from pour_them_all import minify_asset, minify_css, minify_json, minify_markup
+
+
+def test_js_is_left_alone():
+    src = b"if (x) /a  b/.test(y); // a //comment\nvar s = 'a  b';\n" * 20
+    assert minify_asset("player.js", src) == src
+
+
+def test_markup_collapses_whitespace_between_tags():
+    src = "<div>\n    <p>a    b</p>\n\n  <p>c</p>\n</div>\n"
+    assert minify_markup(src) == "<div>\n<p>a b</p>\n<p>c</p>\n</div>"
+
+
+def test_markup_keeps_xml_space_preserve():
+    src = '<svg><text xml:space="preserve">a    b</text>  <text>c    d</text></svg>'
+    assert minify_markup(src) == (
+        '<svg><text xml:space="preserve">a    b</text> <text>c d</text></svg>'
+    )
+
+
+def test_markup_keeps_nested_xml_space_preserve():
+    src = (
+        "<g xml:space='preserve'><g>  a  </g>   <g> b </g></g>  "
+        '<g xml:space="preserve"/>  <g>  c  </g>'
+    )
+    assert minify_markup(src) == (
+        "<g xml:space='preserve'><g>  a  </g>   <g> b </g></g> "
+        '<g xml:space="preserve"/> <g> c </g>'
+    )
+
+
+def test_markup_keeps_raw_elements():
+    for name in ("pre", "textarea", "script", "style"):
+        body = "a    b\n\n  /x  y/.test(z) // c\n/* d */"
+        src = f"<div>  <{name} id='x'>{body}</{name}>  </div>"
+        assert minify_markup(src) == f"<div> <{name} id='x'>{body}</{name}> </div>"
+
+
+def test_markup_keeps_comments_and_attributes():
+    src = '<!--[if IE]>  <p>x</p>  <![endif]--> <a title="a    b">  x  </a>'
+    assert minify_markup(src) == (
+        '<!--[if IE]>  <p>x</p>  <![endif]--> <a title="a    b"> x </a>'
+    )
+
+
+def test_css_comments_and_whitespace():
+    src = "/* note */\na  .b ,\n c {\n  color : red ;\n  margin: 0 auto;\n}\n"
+    assert minify_css(src) == "a .b,c{color : red;margin: 0 auto}"
+
+
+def test_css_keeps_strings_bang_comments_and_escapes():
+    src = '/*! keep */ .a\\  .b { content: "x  /* y */  z"; }'
+    assert minify_css(src) == '/*! keep */ .a\\  .b{content: "x  /* y */  z"}'
+
+
+def test_css_dropped_comment_does_not_become_a_combinator():
+    assert minify_css(".a/**/.b{color:red}") == ".a.b{color:red}"
+    assert minify_css(".a /**/ .b{color:red}") == ".a .b{color:red}"
+    assert minify_css("a/**/b{margin:1px/**/-2px}") == "a b{margin:1px -2px}"
+
+
+def test_json_strips_whitespace_only():
+    assert minify_json('{ "a" : [1, 2],\n "b": "x  y" }') == '{"a":[1,2],"b":"x  y"}'
+    assert minify_json('{"big": 1e400, "e": 1E2, "f": 1.50}') == (
+        '{"big":1e400,"e":1E2,"f":1.50}'
+    )
+    assert minify_json('{"a": 1, "a": 2}') == '{"a":1,"a":2}'
+    assert minify_json('{"s": "q\\" x"}') == '{"s":"q\\" x"}'
+    assert minify_json("{'a': 1}") == "{'a': 1}"